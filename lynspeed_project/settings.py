@@ -311,20 +311,11 @@ CORS_ALLOW_HEADERS = [
     'origin',
     'x-csrftoken',
     'x-requested-with',
+    'idempotency-key',
 ]
 
 CORS_ALLOW_CREDENTIALS = True
 
-# CACHES = {
-#     "default": {
-#         "BACKEND": "django_redis.cache.RedisCache",
-#         "LOCATION": "redis://127.0.0.1:6379/1",
-#         "OPTIONS": {
-#             "CLIENT_CLASS": "django_redis.client.DefaultClient",
-#         }
-#     }
-# }
-
 # Email settings
 MAIL_BACKEND = os.getenv('EMAIL_BACKEND')
 EMAIL_HOST = os.getenv('EMAIL_HOST')
@@ -334,10 +325,33 @@ EMAIL_HOST_USER = os.getenv('EMAIL_HOST_USER')
 EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD')
 DEFAULT_FROM_EMAIL = os.getenv('DEFAULT_FROM_EMAIL')
 
-# CACHES Setting without redis
-CACHES = {
-    "default": {
-        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
-        "LOCATION": "unique-snowflake",  # Optional: A unique identifier for the cache table
+# CACHES: every worker, management command and script must share one cache, since it holds
+# the worksheet index versions, paper pools, admission buckets and idempotency records.
+# Without REDIS_CACHE_URL the per-process LocMemCache is used, which only suits a single
+# development process and the test suite.
+REDIS_CACHE_URL = os.getenv('REDIS_CACHE_URL')
+if REDIS_CACHE_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_CACHE_URL,  # e.g. redis://127.0.0.1:6379/1
+        }
     }
-}
\ No newline at end of file
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "unique-snowflake",  # Optional: A unique identifier for the cache table
+        }
+    }
+
+# Admission control for test session starts (see questionBank/admission.py)
+EXAM_START_RATE = int(os.getenv('EXAM_START_RATE', 50))  # Starts per second across all workers
+EXAM_START_WORKER_CONCURRENCY = int(os.getenv('EXAM_START_WORKER_CONCURRENCY', 8))  # Concurrent starts per worker
+EXAM_START_QUEUE_TIMEOUT = float(os.getenv('EXAM_START_QUEUE_TIMEOUT', 2))  # Seconds a start may wait in line
+
+# Offline exam bundles (see questionBank/views/examBundle_view.py)
+EXAM_BUNDLE_MAX_AGE = int(os.getenv('EXAM_BUNDLE_MAX_AGE', 60 * 60 * 6))  # Seconds a downloaded bundle can be uploaded for
+
+# Weekly subject leaderboards (see questionBank/leaderboards.py)
+LEADERBOARD_SIZE = int(os.getenv('LEADERBOARD_SIZE', 100))  # Candidates kept per subject and week
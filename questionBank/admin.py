@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Subject, Worksheet, Question, TestSession, UserResponse, Result
+from .models import Subject, Worksheet, Question, TestSession, UserResponse, Result, WorksheetExposure, GradingJob, AnswerSheet, ResultDocument, ScoreHistogram, Leaderboard
 
 @admin.register(Subject)
 class SubjectAdmin(admin.ModelAdmin):
@@ -39,8 +39,67 @@ class UserResponseAdmin(admin.ModelAdmin):
     search_fields = ('user__username', 'question__text')
     list_filter = ('selected_option', 'question__worksheet__subject', 'question__worksheet')
 
+@admin.register(AnswerSheet)
+class AnswerSheetAdmin(admin.ModelAdmin):
+    list_display = ('id', 'test_session', 'subject', 'worksheet', 'answered_count', 'correct_count')
+    search_fields = ('test_session__user__email', 'subject__name')
+    list_filter = ('subject',)
+    exclude = ('question_ids', 'selected_options', 'correct')
+    readonly_fields = ('answers',)
+
+    def answers(self, obj):
+        correct_bits = obj.correct_bits
+        return ", ".join(
+            f"{question_id}: {option}{' (correct)' if correct_bits >> position & 1 else ''}"
+            for position, (question_id, option) in enumerate(zip(obj.question_id_list, obj.selected_options))
+        )
+
 @admin.register(Result)
 class ResultAdmin(admin.ModelAdmin):
-    list_display = ('id', 'user', 'subject', 'worksheet', 'score', 'speed', 'timestamp')
+    list_display = ('id', 'user', 'subject', 'worksheet', 'score', 'speed', 'median_time', 'p90_time', 'timestamp')
     search_fields = ('user__username', 'subject__name', 'worksheet__name')
-    list_filter = ('subject', 'worksheet', 'timestamp')
\ No newline at end of file
+    list_filter = ('subject', 'worksheet', 'timestamp')
+
+@admin.register(WorksheetExposure)
+class WorksheetExposureAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'subject', 'seen_count')
+    search_fields = ('user__email', 'subject__name')
+    list_filter = ('subject',)
+
+    def seen_count(self, obj):
+        return bin(obj.seen_bits).count('1')
+
+
+@admin.register(GradingJob)
+class GradingJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'test_session', 'status', 'attempts', 'created_at', 'finished_at')
+    search_fields = ('test_session__user__email',)
+    list_filter = ('status',)
+    readonly_fields = ('last_error',)
+
+
+@admin.register(ResultDocument)
+class ResultDocumentAdmin(admin.ModelAdmin):
+    list_display = ('id', 'test_session', 'etag', 'rendered_at')
+    search_fields = ('test_session__user__email',)
+    readonly_fields = ('document', 'etag')
+
+
+@admin.register(ScoreHistogram)
+class ScoreHistogramAdmin(admin.ModelAdmin):
+    list_display = ('id', 'subject', 'period', 'total')
+    list_filter = ('subject', 'period')
+    readonly_fields = ('counts',)
+
+    def total(self, obj):
+        return int(obj.counts_array.sum())
+
+
+@admin.register(Leaderboard)
+class LeaderboardAdmin(admin.ModelAdmin):
+    list_display = ('id', 'subject', 'week', 'size')
+    list_filter = ('subject', 'week')
+    readonly_fields = ('entries',)
+
+    def size(self, obj):
+        return len(obj.entry_list)
@@ -0,0 +1,98 @@
+import math
+import threading
+import time
+from django.conf import settings
+from django.core.cache import cache
+
+POLL_INTERVAL = 0.05  # seconds between admission attempts while queued
+
+
+class Admission:
+    def __init__(self, admitted, queue_position=0, retry_after=0):
+        self.admitted = admitted
+        self.queue_position = queue_position
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    Caps how fast and how many of an expensive operation may run at once.
+    A token bucket in the shared cache, refilled every second, bounds the rate across all
+    workers; a semaphore bounds concurrency within this worker. Callers that get neither
+    wait briefly in line, then are turned away with their queue position.
+
+    Limits are read from settings on every call:
+    `<PREFIX>_RATE` (admissions per second), `<PREFIX>_WORKER_CONCURRENCY` and
+    `<PREFIX>_QUEUE_TIMEOUT` (seconds a caller may wait).
+    """
+
+    def __init__(self, name, setting_prefix, default_rate, default_concurrency, default_queue_timeout):
+        self.name = name
+        self.setting_prefix = setting_prefix
+        self.default_rate = default_rate
+        self.default_concurrency = default_concurrency
+        self.default_queue_timeout = default_queue_timeout
+        self._lock = threading.Lock()
+        self._running = 0
+
+    def _setting(self, suffix, default):
+        return getattr(settings, f'{self.setting_prefix}_{suffix}', default)
+
+    def _take_token(self, rate):
+        bucket_key = f'admission_{self.name}_{int(time.time())}'
+        cache.add(bucket_key, 0, timeout=2)
+        try:
+            return cache.incr(bucket_key) <= rate
+        except ValueError:
+            # Bucket expired between add and incr; the next second's bucket is fresh
+            return False
+
+    def _try_admit(self, rate, concurrency):
+        with self._lock:
+            if self._running >= concurrency:
+                return False
+            self._running += 1
+        if self._take_token(rate):
+            return True
+        with self._lock:
+            self._running -= 1
+        return False
+
+    def admit(self):
+        rate = self._setting('RATE', self.default_rate)
+        concurrency = self._setting('WORKER_CONCURRENCY', self.default_concurrency)
+        queue_timeout = self._setting('QUEUE_TIMEOUT', self.default_queue_timeout)
+
+        if self._try_admit(rate, concurrency):
+            return Admission(True)
+
+        waiting_key = f'admission_{self.name}_waiting'
+        cache.add(waiting_key, 0, timeout=None)
+        queue_position = cache.incr(waiting_key)
+        try:
+            deadline = time.monotonic() + queue_timeout
+            while time.monotonic() < deadline:
+                time.sleep(POLL_INTERVAL)
+                if self._try_admit(rate, concurrency):
+                    return Admission(True)
+        finally:
+            try:
+                cache.decr(waiting_key)
+            except ValueError:
+                pass
+
+        retry_after = max(1, math.ceil(queue_position / rate)) if rate > 0 else 60
+        return Admission(False, queue_position, retry_after)
+
+    def release(self):
+        with self._lock:
+            self._running -= 1
+
+
+exam_start_admission = AdmissionController(
+    'exam_start',
+    'EXAM_START',
+    default_rate=50,
+    default_concurrency=8,
+    default_queue_timeout=2,
+)
@@ -0,0 +1,95 @@
+from .models import AnswerSheet, Question
+from .worksheet_index import get_worksheet_index
+
+
+class SheetResponse:
+    """
+    Read-only stand-in for a UserResponse row, built from one slot of an AnswerSheet,
+    so serializers and views that expect response objects keep working.
+    """
+
+    def __init__(self, test_session, subject, question_id, selected_option, is_correct, question=None):
+        self.test_session = test_session
+        self.subject = subject
+        self.question_id = question_id
+        self.selected_option = selected_option
+        self.is_correct = is_correct
+        self.question = question
+
+    @property
+    def test_session_id(self):
+        return self.test_session.id
+
+    @property
+    def user_id(self):
+        return self.test_session.user_id
+
+    @property
+    def user(self):
+        return self.test_session.user
+
+    @property
+    def answered(self):
+        return bool(self.selected_option)
+
+
+def build_blank_sheets(test_session, question_ids):
+    """
+    Return unsaved, empty AnswerSheets for the questions, one per subject, with each
+    sheet's questions in the order given. Questions are placed using the worksheet index.
+    """
+    index = get_worksheet_index()
+    questions_by_worksheet = {}
+    for question_id in question_ids:
+        worksheet_id = index.get_question_worksheet(question_id)
+        if worksheet_id is not None:
+            questions_by_worksheet.setdefault(worksheet_id, []).append(question_id)
+
+    return [
+        AnswerSheet(
+            test_session=test_session,
+            subject_id=index.get_worksheet(worksheet_id)["subject_id"],
+            worksheet_id=worksheet_id,
+            question_ids=AnswerSheet.pack_question_ids(worksheet_question_ids),
+            selected_options=AnswerSheet.BLANK * len(worksheet_question_ids),
+        )
+        for worksheet_id, worksheet_question_ids in questions_by_worksheet.items()
+    ]
+
+
+def get_session_responses(test_session, subject_id=None, load_questions=True):
+    """
+    Return a SheetResponse for every question of the session (or of one subject), in
+    sheet order. Unanswered questions have an empty selected_option, like the old
+    placeholder rows. Costs two queries, or one with `load_questions=False`.
+    """
+    sheets = test_session.answer_sheets.select_related('subject').order_by('id')
+    if subject_id is not None:
+        sheets = sheets.filter(subject_id=subject_id)
+    sheets = list(sheets)
+
+    questions = {}
+    if load_questions:
+        questions = Question.objects.in_bulk([question_id for sheet in sheets for question_id in sheet.question_id_list])
+
+    return [response for sheet in sheets for response in sheet_responses(test_session, sheet, questions)]
+
+
+def sheet_responses(test_session, sheet, questions=None):
+    """
+    Return a SheetResponse for every question of one answer sheet, in sheet order,
+    attaching the question objects found in `questions` (a dict keyed by id).
+    """
+    questions = questions or {}
+    correct_bits = sheet.correct_bits
+    return [
+        SheetResponse(
+            test_session,
+            sheet.subject,
+            question_id,
+            '' if option == AnswerSheet.BLANK else option,
+            bool(correct_bits >> position & 1),
+            questions.get(question_id),
+        )
+        for position, (question_id, option) in enumerate(zip(sheet.question_id_list, sheet.selected_options))
+    ]
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class QuestionbankConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'questionBank'
+
+    def ready(self):
+        from . import checks, signals  # noqa: F401
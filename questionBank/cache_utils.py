@@ -1,8 +1,17 @@
-from django.core.cache import cache
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+import hashlib
 import json
-from .models import Subject, TestSession, Result, Worksheet
+import threading
+import uuid
+from .models import Subject, TestSession, TestSessionQuestion, Result, Worksheet, Question
+from .serializers import SubjectSerializer, QuestionSerializer
 
 CACHE_TTL = 60 * 15  # 15 minutes
+WORKSHEET_PAYLOAD_TTL = 60 * 60 * 24  # 1 day; entries are versioned, so the TTL only bounds memory
+RESULTS_CACHE_TTL = 60 * 60 * 24 * 7  # 1 week; a graded session's results never change
+SHARED_VERSION_TTL = 60 * 5  # 5 minutes; bounds how stale a process-local snapshot can get
 
 def get_cached_subjects():
     cache_key = 'all_subjects'
@@ -29,15 +38,218 @@ def get_cached_test_questions(test_session_id):
         cache.set(cache_key, questions, timeout=CACHE_TTL)
     return questions
 
+def test_results_cache_key(user_id, test_session_id):
+    return f"test_results_document_user_{user_id}_session_{test_session_id}"
+
 def get_cached_test_results(user_id, test_session_id):
-    # Retrieve cached data as JSON string and parse it
-    cache_key = f"test_results_user_{user_id}_session_{test_session_id}"
-    cached_data = cache.get(cache_key)
-    if cached_data:
-        return json.loads(cached_data)
-    return None
-
-def cache_test_results(user_id, test_session_id, result_data):
-    # Cache serialized data as a JSON string
-    cache_key = f"test_results_user_{user_id}_session_{test_session_id}"
-    cache.set(cache_key, json.dumps(result_data))
+    # The session's rendered results document as an (etag, JSON text, rankings) triple, or None
+    return cache.get(test_results_cache_key(user_id, test_session_id))
+
+def cache_test_results(documents):
+    # Cache rendered results documents, given as {(user_id, test_session_id): (etag, JSON text, rankings)}
+    cache.set_many({
+        test_results_cache_key(user_id, test_session_id): document
+        for (user_id, test_session_id), document in documents.items()
+    }, timeout=RESULTS_CACHE_TTL)
+
+def cache_is_shared():
+    """
+    Whether the default cache is visible to every process. Paper pools, admission buckets,
+    idempotency records and snapshot versions only work across workers when it is.
+    """
+    return not isinstance(caches['default'], (LocMemCache, DummyCache))
+
+def get_shared_version(key):
+    """
+    Return the version token stored under `key`, publishing one if the cache has none
+    (cold, cleared or expired). Process-local snapshots compare it to decide when to reload;
+    since tokens expire, every snapshot is reloaded at least once per SHARED_VERSION_TTL
+    even if a change was never published.
+    """
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, timeout=SHARED_VERSION_TTL)
+        version = cache.get(key)
+    return version
+
+def publish_shared_version(key):
+    cache.set(key, uuid.uuid4().hex, timeout=SHARED_VERSION_TTL)
+
+class SharedSnapshot:
+    """
+    Process-resident holder of an immutable snapshot built by `load(version)`, reloaded
+    whenever the shared version under `version_key` moves. A snapshot is never mutated
+    once built; a refresh swaps in a new instance. A warm get() costs one cache lookup
+    and no queries.
+    """
+
+    def __init__(self, version_key, load):
+        self.version_key = version_key
+        self._load = load
+        self._snapshot = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        version = get_shared_version(self.version_key)
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.version == version:
+            return snapshot
+
+        with self._lock:
+            if self._snapshot is None or self._snapshot.version != version:
+                self._snapshot = self._load(version)
+            return self._snapshot
+
+    def invalidate(self):
+        """
+        Publish a new version so every worker reloads its snapshot on next use.
+        """
+        publish_shared_version(self.version_key)
+        self._snapshot = None
+
+def _worksheet_version_key(worksheet_id):
+    return f'worksheet_version_{worksheet_id}'
+
+def bump_worksheet_content_version(*worksheet_ids):
+    """
+    Give the worksheets a new content version, orphaning any payloads rendered for the old one.
+    """
+    cache.set_many({_worksheet_version_key(worksheet_id): uuid.uuid4().hex for worksheet_id in worksheet_ids}, timeout=None)
+
+def get_worksheet_content_versions(worksheet_ids):
+    version_keys = {worksheet_id: _worksheet_version_key(worksheet_id) for worksheet_id in worksheet_ids}
+    cached = cache.get_many(version_keys.values())
+    missing = {key: uuid.uuid4().hex for key in version_keys.values() if key not in cached}
+    if missing:
+        for key, version in missing.items():
+            cache.add(key, version, timeout=None)
+        cached.update(cache.get_many(missing.keys()))
+    return {worksheet_id: cached.get(key) for worksheet_id, key in version_keys.items()}
+
+def _pack_answer_key(questions):
+    return (tuple(question.id for question in questions), ''.join(question.correct_option for question in questions))
+
+def render_worksheet_payloads(worksheet_ids, answer_keys=None):
+    """
+    Serialize worksheets, their subject and their questions into plain JSON-ready fragments,
+    each with a hash of its content. Uses two queries however many worksheets are rendered.
+    Pass a dict as `answer_keys` to also collect each worksheet's packed answer key.
+    """
+    worksheets = Worksheet.objects.select_related('subject').in_bulk(worksheet_ids)
+    questions_by_worksheet = {worksheet_id: [] for worksheet_id in worksheets}
+    for question in Question.objects.filter(worksheet_id__in=worksheets.keys()).order_by('order', 'id'):
+        questions_by_worksheet[question.worksheet_id].append(question)
+
+    payloads = {}
+    for worksheet_id, worksheet in worksheets.items():
+        payload = {
+            "subject": SubjectSerializer(worksheet.subject).data,
+            "worksheet": {
+                "worksheet_id": worksheet.id,
+                "worksheet_title": worksheet.name,
+                "questions": QuestionSerializer(questions_by_worksheet[worksheet_id], many=True).data,
+            },
+        }
+        payload["content_hash"] = hashlib.sha256(
+            json.dumps(payload, sort_keys=True, default=str).encode()
+        ).hexdigest()[:32]
+        payloads[worksheet_id] = payload
+        if answer_keys is not None:
+            answer_keys[worksheet_id] = _pack_answer_key(questions_by_worksheet[worksheet_id])
+    return payloads
+
+def get_worksheet_payloads(worksheet_ids):
+    """
+    Return {worksheet_id: payload} of pre-serialized worksheets, keyed by worksheet id and
+    content version. Only worksheets missing from the cache are rendered; their answer
+    keys are cached alongside, since the same rows are already loaded.
+    """
+    versions = get_worksheet_content_versions(worksheet_ids)
+    payload_keys = {
+        worksheet_id: f'worksheet_payload_{worksheet_id}_{version}'
+        for worksheet_id, version in versions.items()
+    }
+    cached = cache.get_many(payload_keys.values())
+    payloads = {worksheet_id: cached[key] for worksheet_id, key in payload_keys.items() if key in cached}
+
+    missing_ids = [worksheet_id for worksheet_id in worksheet_ids if worksheet_id not in payloads]
+    if missing_ids:
+        answer_keys = {}
+        rendered = render_worksheet_payloads(missing_ids, answer_keys)
+        cache.set_many(
+            {payload_keys[worksheet_id]: payload for worksheet_id, payload in rendered.items()},
+            timeout=WORKSHEET_PAYLOAD_TTL
+        )
+        cache.set_many(
+            {_answer_key_name(worksheet_id, versions[worksheet_id]): key for worksheet_id, key in answer_keys.items()},
+            timeout=WORKSHEET_PAYLOAD_TTL
+        )
+        payloads.update(rendered)
+
+    return payloads
+
+def _answer_key_name(worksheet_id, version):
+    return f'answer_key_{worksheet_id}_{version}'
+
+def get_answer_keys(worksheet_ids):
+    """
+    Return {worksheet_id: (question_ids, correct_options)} where correct_options is a string
+    such as "ABDC" aligned with question_ids. Keys are cached per worksheet content version,
+    so a Question save orphans them; misses are loaded together in one query.
+    """
+    versions = get_worksheet_content_versions(worksheet_ids)
+    key_names = {worksheet_id: _answer_key_name(worksheet_id, version) for worksheet_id, version in versions.items()}
+    cached = cache.get_many(key_names.values())
+    answer_keys = {worksheet_id: cached[name] for worksheet_id, name in key_names.items() if name in cached}
+
+    missing_ids = [worksheet_id for worksheet_id in worksheet_ids if worksheet_id not in answer_keys]
+    if missing_ids:
+        questions_by_worksheet = {worksheet_id: [] for worksheet_id in missing_ids}
+        questions = Question.objects.filter(worksheet_id__in=missing_ids).order_by('order', 'id').only(
+            'id', 'worksheet_id', 'correct_option'
+        )
+        for question in questions:
+            questions_by_worksheet[question.worksheet_id].append(question)
+        loaded = {
+            worksheet_id: _pack_answer_key(worksheet_questions)
+            for worksheet_id, worksheet_questions in questions_by_worksheet.items()
+        }
+        cache.set_many({key_names[worksheet_id]: key for worksheet_id, key in loaded.items()}, timeout=WORKSHEET_PAYLOAD_TTL)
+        answer_keys.update(loaded)
+
+    return answer_keys
+
+SESSION_MANIFEST_TTL = 60 * 60 * 6  # 6 hours, comfortably longer than an exam
+
+def cache_session_manifest(test_session_id, user_id, manifest):
+    """
+    Remember which worksheets and questions a session was given, so per-session
+    lookups during the exam do not need the database.
+    """
+    cache.set(f'session_manifest_{test_session_id}', {"user_id": user_id, "subjects": manifest}, timeout=SESSION_MANIFEST_TTL)
+
+def get_cached_session_manifest(test_session_id):
+    return cache.get(f'session_manifest_{test_session_id}')
+
+def get_session_manifest(test_session_id, user_id):
+    """
+    Return the manifest entries of the user's session, rebuilding them from the session's
+    questions (and caching them again) when evicted. None if the session is not the user's.
+    """
+    manifest = get_cached_session_manifest(test_session_id)
+    if manifest is not None:
+        return manifest['subjects'] if manifest['user_id'] == user_id else None
+
+    if not TestSession.objects.filter(id=test_session_id, user_id=user_id).exists():
+        return None
+    subjects = {}
+    rows = TestSessionQuestion.objects.filter(test_session_id=test_session_id).values_list(
+        'question__worksheet__subject_id', 'question__worksheet_id', 'question_id'
+    ).order_by('question__order', 'question_id')
+    for subject_id, worksheet_id, question_id in rows:
+        entry = subjects.setdefault(subject_id, {"id": subject_id, "worksheet_id": worksheet_id, "question_ids": []})
+        entry["question_ids"].append(question_id)
+
+    manifest = list(subjects.values())
+    cache_session_manifest(test_session_id, user_id, manifest)
+    return manifest
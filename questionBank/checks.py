@@ -0,0 +1,17 @@
+from django.core.checks import Error, Tags, register
+from .cache_utils import cache_is_shared
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """
+    Paper pools, the exam start token bucket and idempotency records live in the cache,
+    so a deployment with several workers needs a cache they all share.
+    """
+    if cache_is_shared():
+        return []
+    return [Error(
+        "The default cache is local to each process.",
+        hint="Set REDIS_CACHE_URL so every worker and management command shares one cache.",
+        id='questionBank.E001',
+    )]
@@ -0,0 +1,89 @@
+import random
+from django.core.cache import cache
+from django.db import connection
+from .models import WorksheetExposure
+
+EXPOSURE_TTL = 60 * 60 * 24  # 1 day; the table is the source of truth
+
+def _exposure_key(user_id):
+    return f'worksheet_exposure_{user_id}'
+
+def load_exposures(user_id):
+    """
+    Return {subject_id: seen bitmap as int} for the user, from the cache or with one query.
+    """
+    exposures = cache.get(_exposure_key(user_id))
+    if exposures is None:
+        exposures = {
+            exposure.subject_id: exposure.seen_bits
+            for exposure in WorksheetExposure.objects.filter(user_id=user_id).only('subject_id', 'seen')
+        }
+        cache.set(_exposure_key(user_id), exposures, timeout=EXPOSURE_TTL)
+    return exposures
+
+def is_seen(index, worksheet_id, seen_bits):
+    position = index.get_worksheet_position(worksheet_id)
+    return position is not None and bool(seen_bits >> position & 1)
+
+def has_unseen(index, subject_id, seen_bits):
+    worksheet_count = len(index.get_worksheet_ids(subject_id))
+    return (seen_bits & ((1 << worksheet_count) - 1)) != (1 << worksheet_count) - 1
+
+def choose_unseen_worksheet(index, subject_id, seen_bits):
+    """
+    Pick a random worksheet the user has not been served yet; once every worksheet of
+    the subject has been seen, pick from all of them again.
+    """
+    worksheet_ids = index.get_worksheet_ids(subject_id)
+    if not worksheet_ids:
+        return None
+    unseen = [worksheet_id for position, worksheet_id in enumerate(worksheet_ids) if not seen_bits >> position & 1]
+    return random.choice(unseen or worksheet_ids)
+
+def record_exposures(user_id, index, worksheet_ids, exposures):
+    """
+    Mark the worksheets as seen, for all subjects in one upsert. A subject whose worksheets
+    have all been seen starts a new cycle with just the worksheet served now.
+    """
+    updated = {}
+    for worksheet_id in worksheet_ids:
+        position = index.get_worksheet_position(worksheet_id)
+        if position is None:
+            continue
+        subject_id = index.get_worksheet(worksheet_id)["subject_id"]
+        seen_bits = exposures.get(subject_id, 0)
+        if not has_unseen(index, subject_id, seen_bits):
+            seen_bits = 0
+        updated[subject_id] = seen_bits | (1 << position)
+
+    if not updated:
+        return exposures
+
+    WorksheetExposure.objects.bulk_create(
+        [
+            WorksheetExposure(user_id=user_id, subject_id=subject_id, seen=seen_bits.to_bytes((seen_bits.bit_length() + 7) // 8, 'little'))
+            for subject_id, seen_bits in updated.items()
+        ],
+        update_conflicts=True,
+        # MySQL's ON DUPLICATE KEY UPDATE takes no conflict target
+        unique_fields=['user', 'subject'] if connection.features.supports_update_conflicts_with_target else None,
+        update_fields=['seen'],
+    )
+    exposures = {**exposures, **updated}
+    cache.set(_exposure_key(user_id), exposures, timeout=EXPOSURE_TTL)
+    return exposures
+
+def drop_worksheet_position(subject_id, position):
+    """
+    Close the gap a deleted worksheet leaves at `position` in the subject's id order: every
+    later bit moves down one place, so the bitmaps keep matching the remaining worksheets.
+    """
+    exposures = list(WorksheetExposure.objects.filter(subject_id=subject_id).only('user_id', 'seen'))
+    low_mask = (1 << position) - 1
+    for exposure in exposures:
+        seen_bits = exposure.seen_bits
+        seen_bits = (seen_bits & low_mask) | (seen_bits >> (position + 1) << position)
+        exposure.seen = seen_bits.to_bytes((seen_bits.bit_length() + 7) // 8, 'little')
+
+    WorksheetExposure.objects.bulk_update(exposures, ['seen'])
+    cache.delete_many([_exposure_key(exposure.user_id) for exposure in exposures])
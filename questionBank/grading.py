@@ -0,0 +1,223 @@
+from datetime import timedelta
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from PerformanceApp.models import PerformanceRecord, Subject as PerformanceSubject
+from .models import AnswerSheet, GradingJob, Question, Result, TestSession, TestSessionQuestion
+from .cache_utils import get_answer_keys, get_cached_session_manifest
+from .result_documents import render_result_documents, store_result_documents
+from .score_histograms import record_scores
+from .leaderboards import record_leaderboard_results
+from .utils import logger
+
+VALID_OPTIONS = {option for option, _ in Question.OPTION_CHOICES}
+GRADING_STALE_AFTER = timedelta(minutes=10)  # A running job older than this belongs to a dead worker
+
+def load_answer_key(test_session):
+    """
+    Return {question_id: correct_option} for every question assigned to the session.
+    Built from the cached session manifest and packed worksheet answer keys, so it
+    normally costs no queries; falls back to one query when the manifest is gone.
+    """
+    manifest = get_cached_session_manifest(test_session.id)
+    if manifest is None:
+        return dict(
+            TestSessionQuestion.objects.filter(test_session=test_session)
+            .values_list('question_id', 'question__correct_option')
+        )
+
+    entries = [entry for entry in manifest['subjects'] if entry['worksheet_id'] is not None]
+    packed_keys = get_answer_keys([entry['worksheet_id'] for entry in entries])
+    answer_key = {}
+    for entry in entries:
+        question_ids, correct_options = packed_keys.get(entry['worksheet_id'], ((), ''))
+        worksheet_key = dict(zip(question_ids, correct_options))
+        # Only the questions the session was actually given, even if the worksheet changed since
+        answer_key.update(
+            (question_id, worksheet_key[question_id])
+            for question_id in entry['question_ids']
+            if question_id in worksheet_key
+        )
+    return answer_key
+
+def save_responses(test_session, answers, answer_key=None, elapsed_ms=None):
+    """
+    Write {question_id: selected_option} into the session's answer sheets, with correctness
+    computed in memory against the answer key, plus any {question_id: milliseconds} timings. The sheets are locked, updated in memory and
+    written back in one statement. Answers to questions outside the session or with an
+    invalid option are skipped. Returns the ids of the questions saved.
+    """
+    answers = {
+        int(question_id): option
+        for question_id, option in answers.items()
+        if isinstance(option, str) and option in VALID_OPTIONS
+    }
+    if not answers:
+        return set()
+
+    if answer_key is None:
+        answer_key = load_answer_key(test_session)
+    answers = {question_id: option for question_id, option in answers.items() if question_id in answer_key}
+    if not answers:
+        return set()
+
+    saved_question_ids = set()
+    with transaction.atomic(savepoint=False):
+        changed = []
+        for sheet in AnswerSheet.objects.select_for_update().filter(test_session=test_session):
+            written = sheet.record_answers(answers, answer_key, elapsed_ms)
+            if written:
+                saved_question_ids |= written
+                changed.append(sheet)
+        if changed:
+            AnswerSheet.objects.bulk_update(changed, ['selected_options', 'correct', 'elapsed_ms'])
+    return saved_question_ids
+
+def enqueue_grading(test_session):
+    return GradingJob.objects.create(test_session=test_session)
+
+def claim_grading_jobs(limit):
+    """
+    Mark up to `limit` pending (or abandoned) jobs as running and return them.
+    Rows locked by another worker are skipped, so several workers can drain the queue.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        jobs = list(
+            GradingJob.objects.select_for_update(skip_locked=True)
+            .filter(Q(status=GradingJob.PENDING) | Q(status=GradingJob.RUNNING, started_at__lt=now - GRADING_STALE_AFTER))
+            .order_by('id')[:limit]
+        )
+        GradingJob.objects.filter(id__in=[job.id for job in jobs]).update(
+            status=GradingJob.RUNNING, started_at=now, attempts=F('attempts') + 1
+        )
+    for job in jobs:
+        job.status = GradingJob.RUNNING
+        job.started_at = now
+        job.attempts += 1
+    return jobs
+
+def grade_test_sessions(test_sessions):
+    """
+    Grade submitted sessions from their answer sheets: settle the correctness bitmaps,
+    replace the per-subject Result rows, set each TestSession.score, add the matching
+    PerformanceRecord entries, count the scores into the subject score histograms and
+    weekly leaderboards, then store each session's rendered results document.
+    A sheet already holds one session's answers to one subject, so one read of the
+    sheets yields every subject's counts; the writes are one bulk statement per table,
+    however many sessions are graded. Call it in a transaction.
+    Returns the Result rows created.
+    """
+    sessions = {test_session.id: test_session for test_session in test_sessions}
+    sheets = list(
+        AnswerSheet.objects.filter(test_session_id__in=sessions).select_related('subject').order_by('test_session_id', 'id')
+    )
+    # The packed worksheet keys are cached per content version, so a warm grade reads no questions
+    answer_key = {}
+    for question_ids, correct_options in get_answer_keys(
+        {sheet.worksheet_id for sheet in sheets if sheet.worksheet_id is not None}
+    ).values():
+        answer_key.update(zip(question_ids, correct_options))
+    regraded = [sheet for sheet in sheets if sheet.grade(answer_key)]
+
+    # Without per-question timings, fall back to spreading the session duration over its answers
+    answered_counts = {}
+    for sheet in sheets:
+        answered_counts[sheet.test_session_id] = answered_counts.get(sheet.test_session_id, 0) + sheet.answered_count
+    fallback_speeds = {
+        session_id: (test_session.duration or 0) * 60 / answered_counts[session_id] if answered_counts.get(session_id) else 0
+        for session_id, test_session in sessions.items()
+    }
+
+    results = []
+    for sheet in sheets:
+        speed, median_time, p90_time = sheet.timing_stats() or (fallback_speeds[sheet.test_session_id], None, None)
+        results.append(Result(
+            user_id=sessions[sheet.test_session_id].user_id,
+            subject=sheet.subject,
+            worksheet_id=sheet.worksheet_id,
+            test_session=sessions[sheet.test_session_id],
+            score=sheet.correct_count / len(sheet.selected_options) * 100 if sheet.selected_options else 0,
+            speed=speed,
+            median_time=median_time,
+            p90_time=p90_time,
+        ))
+
+    # Each subject is marked out of 100, so a four-subject paper is scored out of 400
+    totals = {session_id: 0 for session_id in sessions}
+    for result in results:
+        totals[result.test_session_id] += result.score
+    for session_id, test_session in sessions.items():
+        test_session.score = round(totals[session_id])
+
+    if regraded:
+        AnswerSheet.objects.bulk_update(regraded, ['correct'])
+    # A regrade replaces earlier Results, whose scores come back out of the histograms
+    replaced = list(Result.objects.filter(test_session_id__in=sessions).values_list('subject_id', 'score', 'timestamp'))
+    if replaced:
+        Result.objects.filter(test_session_id__in=sessions).delete()
+    Result.objects.bulk_create(results)
+    TestSession.objects.bulk_update(sessions.values(), ['score'])
+    _record_performance(results)
+    record_scores([(result.subject_id, result.score, result.timestamp) for result in results], replaced)
+    record_leaderboard_results(results)
+    store_result_documents(sessions.values(), render_result_documents(sessions.values(), sheets, results))
+    return results
+
+def grade_test_session(test_session):
+    return grade_test_sessions([test_session])
+
+def _record_performance(results):
+    # PerformanceApp keeps its own subject table; match it by name
+    names = {result.subject.name for result in results}
+    PerformanceSubject.objects.bulk_create([PerformanceSubject(name=name) for name in names], ignore_conflicts=True)
+    performance_subjects = PerformanceSubject.objects.in_bulk(names, field_name='name')
+    PerformanceRecord.objects.bulk_create([
+        PerformanceRecord(
+            user_id=result.user_id,
+            subject=performance_subjects[result.subject.name],
+            score=result.score,
+            speed=result.speed,
+        )
+        for result in results
+    ])
+
+def process_grading_job(job, max_attempts):
+    """
+    Grade one claimed job. A failure puts it back in the queue until it has used
+    `max_attempts`, after which it is marked failed. Returns True when graded.
+    """
+    try:
+        with transaction.atomic():
+            grade_test_session(job.test_session)
+            GradingJob.objects.filter(id=job.id).update(status=GradingJob.DONE, finished_at=timezone.now(), last_error='')
+    except Exception as exc:
+        logger.exception(f"Grading failed for session {job.test_session_id} (attempt {job.attempts})")
+        GradingJob.objects.filter(id=job.id).update(
+            status=GradingJob.FAILED if job.attempts >= max_attempts else GradingJob.PENDING,
+            last_error=str(exc),
+        )
+        return False
+    return True
+
+def process_grading_jobs(jobs, max_attempts):
+    """
+    Grade claimed jobs together in one transaction. If the batch fails, each job is
+    graded on its own so a bad session only fails its own job.
+    Returns the number of jobs graded and failed.
+    """
+    if len(jobs) > 1:
+        try:
+            with transaction.atomic():
+                test_sessions = TestSession.objects.in_bulk([job.test_session_id for job in jobs])
+                grade_test_sessions(test_sessions.values())
+                GradingJob.objects.filter(id__in=[job.id for job in jobs]).update(
+                    status=GradingJob.DONE, finished_at=timezone.now(), last_error=''
+                )
+            return len(jobs), 0
+        except Exception:
+            logger.exception(f"Grading a batch of {len(jobs)} sessions failed; grading them one at a time")
+
+    graded = sum(process_grading_job(job, max_attempts) for job in jobs)
+    return graded, len(jobs) - graded
+
@@ -0,0 +1,72 @@
+import hashlib
+import json
+from functools import wraps
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework.response import Response
+from .utils import format_error_response
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+IDEMPOTENCY_TTL = 60 * 60 * 24  # 1 day
+IDEMPOTENCY_LOCK_TTL = 60  # Upper bound on how long one request may hold a key
+MAX_KEY_LENGTH = 255
+
+def _fingerprint(data, query_params):
+    # The query string is part of the request: it can change what the handler returns
+    request_parts = [data, sorted(query_params.lists())]
+    return hashlib.sha256(json.dumps(request_parts, sort_keys=True, default=str).encode()).hexdigest()
+
+def idempotent(scope):
+    """
+    Decorate an APIView handler so a retried request carrying the same Idempotency-Key
+    gets the original response back instead of running the handler again.
+    Keys are scoped per user and per endpoint; requests without the header are unaffected.
+    """
+    def decorator(handler):
+        @wraps(handler)
+        def wrapper(self, request, *args, **kwargs):
+            key = request.headers.get(IDEMPOTENCY_HEADER)
+            if not key:
+                return handler(self, request, *args, **kwargs)
+
+            if len(key) > MAX_KEY_LENGTH:
+                return Response(format_error_response(
+                    status.HTTP_400_BAD_REQUEST,
+                    "INVALID_IDEMPOTENCY_KEY",
+                    f"{IDEMPOTENCY_HEADER} must be at most {MAX_KEY_LENGTH} characters."
+                ), status=status.HTTP_400_BAD_REQUEST)
+
+            cache_key = f'idempotency_{scope}_{request.user.id}_{hashlib.sha256(key.encode()).hexdigest()}'
+            fingerprint = _fingerprint(request.data, request.query_params)
+
+            stored = cache.get(cache_key)
+            if stored is None:
+                if not cache.add(f'{cache_key}_lock', True, timeout=IDEMPOTENCY_LOCK_TTL):
+                    return Response(format_error_response(
+                        status.HTTP_409_CONFLICT,
+                        "IDEMPOTENCY_KEY_IN_USE",
+                        "A request with this idempotency key is still being processed."
+                    ), status=status.HTTP_409_CONFLICT)
+                try:
+                    response = handler(self, request, *args, **kwargs)
+                    # Overload and conflict responses are transient; a retry should run again
+                    if response.status_code < 500 and response.status_code not in (409, 429):
+                        cache.set(cache_key, {
+                            "fingerprint": fingerprint,
+                            "status": response.status_code,
+                            "data": response.data,
+                        }, timeout=IDEMPOTENCY_TTL)
+                finally:
+                    cache.delete(f'{cache_key}_lock')
+                return response
+
+            if stored["fingerprint"] != fingerprint:
+                return Response(format_error_response(
+                    status.HTTP_422_UNPROCESSABLE_ENTITY,
+                    "IDEMPOTENCY_KEY_REUSED",
+                    "This idempotency key was already used with a different request body or query."
+                ), status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+            return Response(stored["data"], status=stored["status"], headers={"Idempotent-Replayed": "true"})
+        return wrapper
+    return decorator
@@ -0,0 +1,106 @@
+from datetime import datetime, timedelta
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from .models import Leaderboard, Result
+from .utils import update_subject_rows
+
+LEADERBOARD_CACHE_TTL = 60 * 60  # 1 hour; dropped whenever grading changes a leaderboard
+REBUILD_CHUNK_SIZE = 2000
+
+
+def leaderboard_week(moment):
+    return timezone.localtime(moment).strftime('%G-W%V')
+
+def week_bounds(week):
+    """
+    Return the aware [start, end) datetimes of an ISO week given as 'YYYY-Www'.
+    Raises ValueError for a malformed or impossible week.
+    """
+    year, number = week.split('-W')
+    start = timezone.make_aware(datetime.fromisocalendar(int(year), int(number), 1))
+    return start, start + timedelta(days=7)
+
+def record_leaderboard_results(results):
+    """
+    Merge graded Results into the weekly leaderboards of their subjects. The leaderboards
+    are created, locked and written back in three statements however many results are
+    merged, and their cached copies are dropped once the surrounding transaction commits.
+    A regrade that lowers a score leaves the earlier, higher entry until the week is rebuilt.
+    """
+    entries = {}
+    for result in results:
+        entries.setdefault((result.subject_id, leaderboard_week(result.timestamp)), []).append(
+            (result.score, result.speed, result.user_id)
+        )
+    if not entries:
+        return
+
+    update_subject_rows(
+        Leaderboard, 'week', entries,
+        lambda leaderboard, week_entries: leaderboard.add_entries(week_entries, settings.LEADERBOARD_SIZE),
+        ['entries'],
+    )
+
+    keys = [_cache_key(subject_id, week) for subject_id, week in entries]
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+def get_leaderboard(subject_id, week):
+    """
+    Return the ranked (user_id, full_name, score, speed) entries of a subject's week.
+    A warm call is one cache lookup; a cold one reads the stored leaderboard and the
+    names of its users, one query each.
+    """
+    cache_key = _cache_key(subject_id, week)
+    ranking = cache.get(cache_key)
+    if ranking is None:
+        leaderboard = Leaderboard.objects.filter(subject_id=subject_id, week=week).first()
+        entries = leaderboard.entry_list if leaderboard else []
+        names = dict(
+            get_user_model().objects.filter(id__in=[user_id for _, _, user_id in entries]).values_list('id', 'full_name')
+        ) if entries else {}
+        ranking = [(user_id, names.get(user_id, ''), score, speed) for score, speed, user_id in entries]
+        cache.set(cache_key, ranking, timeout=LEADERBOARD_CACHE_TTL)
+    return ranking
+
+def rebuild_leaderboards(week):
+    """
+    Recompute every subject's leaderboard for one week from its Result rows and replace
+    the stored ones. Rows are merged in chunks, so memory stays bounded by the leaderboard
+    size and the chunk size however many results the week has. Returns the number rebuilt.
+    """
+    start, end = week_bounds(week)
+    leaderboards = {}
+    pending = {}
+    rows = Result.objects.filter(timestamp__gte=start, timestamp__lt=end).values_list(
+        'subject_id', 'score', 'speed', 'user_id'
+    )
+    for subject_id, score, speed, user_id in rows.iterator(chunk_size=REBUILD_CHUNK_SIZE):
+        subject_pending = pending.setdefault(subject_id, [])
+        subject_pending.append((score, speed, user_id))
+        if len(subject_pending) >= REBUILD_CHUNK_SIZE:
+            _merge(leaderboards, week, subject_id, subject_pending)
+    for subject_id, subject_pending in pending.items():
+        _merge(leaderboards, week, subject_id, subject_pending)
+    leaderboards = list(leaderboards.values())
+
+    with transaction.atomic():
+        stale_keys = [
+            _cache_key(subject_id, week)
+            for subject_id in Leaderboard.objects.filter(week=week).values_list('subject_id', flat=True)
+        ]
+        Leaderboard.objects.filter(week=week).delete()
+        Leaderboard.objects.bulk_create(leaderboards)
+
+    cache.delete_many(stale_keys + [_cache_key(leaderboard.subject_id, week) for leaderboard in leaderboards])
+    return len(leaderboards)
+
+def _merge(leaderboards, week, subject_id, entries):
+    leaderboard = leaderboards.setdefault(subject_id, Leaderboard(subject_id=subject_id, week=week))
+    leaderboard.add_entries(entries, settings.LEADERBOARD_SIZE)
+    entries.clear()
+
+def _cache_key(subject_id, week):
+    return f'leaderboard_{subject_id}_{week}'
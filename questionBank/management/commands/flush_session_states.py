@@ -0,0 +1,22 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from questionBank.models import TestSession
+from questionBank.session_state import SESSION_STATE_TTL, flush_session_state
+
+
+class Command(BaseCommand):
+    help = "Write cached in-progress answers of open test sessions to the database."
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(seconds=SESSION_STATE_TTL)
+        flushed_sessions = 0
+        flushed_answers = 0
+
+        for test_session in TestSession.objects.filter(completed=False, start_time__gte=cutoff).only('id', 'user_id').iterator():
+            saved_question_ids = flush_session_state(test_session)
+            if saved_question_ids:
+                flushed_sessions += 1
+                flushed_answers += len(saved_question_ids)
+
+        self.stdout.write(f"Flushed {flushed_answers} answers from {flushed_sessions} sessions")
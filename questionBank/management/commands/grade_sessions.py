@@ -0,0 +1,30 @@
+import time
+from django.core.management.base import BaseCommand
+from questionBank.grading import claim_grading_jobs, process_grading_jobs
+
+
+class Command(BaseCommand):
+    help = "Grade submitted test sessions waiting in the grading queue."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50, help="Jobs to claim at a time.")
+        parser.add_argument('--max-attempts', type=int, default=3, help="Attempts before a job is marked failed.")
+        parser.add_argument('--loop', action='store_true', help="Keep polling the queue instead of exiting when it is empty.")
+        parser.add_argument('--interval', type=float, default=1.0, help="Seconds to wait between polls with --loop.")
+
+    def handle(self, *args, **options):
+        graded = 0
+        failed = 0
+
+        while True:
+            jobs = claim_grading_jobs(options['batch_size'])
+            batch_graded, batch_failed = process_grading_jobs(jobs, options['max_attempts'])
+            graded += batch_graded
+            failed += batch_failed
+
+            if not jobs:
+                if not options['loop']:
+                    break
+                time.sleep(options['interval'])
+
+        self.stdout.write(f"Graded {graded} sessions, {failed} failed")
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from questionBank.leaderboards import leaderboard_week, rebuild_leaderboards
+
+
+class Command(BaseCommand):
+    help = "Recompute one week's subject leaderboards from its graded Results."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--week', help="ISO week to rebuild as YYYY-Www; defaults to the current week.")
+
+    def handle(self, *args, **options):
+        week = options['week'] or leaderboard_week(timezone.now())
+        try:
+            count = rebuild_leaderboards(week)
+        except ValueError:
+            raise CommandError(f"Invalid week: {week}")
+        self.stdout.write(f"Rebuilt {count} leaderboards for {week}")
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from questionBank.score_histograms import rebuild_score_histograms
+
+
+class Command(BaseCommand):
+    help = "Recount the per-subject score histograms from every graded Result."
+
+    def handle(self, *args, **options):
+        count = rebuild_score_histograms()
+        self.stdout.write(f"Rebuilt {count} score histograms")
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+from questionBank.cache_utils import cache_is_shared
+from questionBank.models import Subject
+from questionBank.paper_pool import get_popular_combinations, pool_depth, refill_pool
+
+
+class Command(BaseCommand):
+    help = "Refill the pools of pre-generated exam papers and report their depth."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=50, help="Papers to keep ready per subject combination.")
+        parser.add_argument('--top', type=int, default=20, help="Number of popular combinations to refill.")
+        parser.add_argument('--subjects', help="Comma-separated subject names to refill instead of the popular combinations.")
+        parser.add_argument('--report', action='store_true', help="Only report pool depth, without refilling.")
+
+    def handle(self, *args, **options):
+        if not cache_is_shared():
+            raise CommandError(
+                "Paper pools need a cache shared with the web workers; set REDIS_CACHE_URL. "
+                "Papers built into this process's local cache would never be served."
+            )
+
+        subjects_by_id = Subject.objects.in_bulk()
+
+        if options['subjects']:
+            names = [name.strip() for name in options['subjects'].split(',')]
+            subject_ids = [subject.id for subject in subjects_by_id.values() if subject.name in names]
+            if len(subject_ids) != len(names):
+                raise CommandError(f"Unknown subject in: {options['subjects']}")
+            combinations = [tuple(sorted(subject_ids))]
+        else:
+            combinations = get_popular_combinations(options['top'])
+
+        for subject_ids in combinations:
+            subjects = [subjects_by_id[subject_id] for subject_id in subject_ids]
+            if options['report']:
+                depth = pool_depth(subject_ids)
+            else:
+                depth = refill_pool(subjects, options['size'])
+            names = ', '.join(subject.name for subject in subjects)
+            self.stdout.write(f"{names}: {depth} papers ready")
@@ -0,0 +1,32 @@
+# Generated by Django 5.0.6 on 2026-10-18 10:44
+
+from django.db import migrations
+from django.db.models import Max
+
+
+def remove_duplicate_responses(apps, schema_editor):
+    """
+    Keep only the latest response per session and question so the unique constraint can apply.
+    """
+    UserResponse = apps.get_model('questionBank', 'UserResponse')
+    latest_ids = (
+        UserResponse.objects.values('test_session_id', 'question_id')
+        .annotate(latest_id=Max('id'))
+        .values_list('latest_id', flat=True)
+    )
+    UserResponse.objects.exclude(id__in=list(latest_ids)).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('questionBank', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_responses, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='userresponse',
+            unique_together={('test_session', 'question')},
+        ),
+    ]
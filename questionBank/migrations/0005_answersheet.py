@@ -0,0 +1,78 @@
+# Generated by Django 5.0.6 on 2026-10-18 10:54
+
+import struct
+import django.db.models.deletion
+from django.db import migrations, models
+
+BACKFILL_BATCH_SIZE = 500
+
+
+def backfill_answer_sheets(apps, schema_editor):
+    """
+    Build one AnswerSheet per session and subject from the existing question assignments
+    and UserResponse rows. The UserResponse rows are left in place.
+    """
+    TestSession = apps.get_model('questionBank', 'TestSession')
+    TestSessionQuestion = apps.get_model('questionBank', 'TestSessionQuestion')
+    UserResponse = apps.get_model('questionBank', 'UserResponse')
+    AnswerSheet = apps.get_model('questionBank', 'AnswerSheet')
+
+    session_ids = list(TestSession.objects.order_by('id').values_list('id', flat=True))
+    for start in range(0, len(session_ids), BACKFILL_BATCH_SIZE):
+        batch = session_ids[start:start + BACKFILL_BATCH_SIZE]
+        responses = {
+            (session_id, question_id): (selected_option, is_correct)
+            for session_id, question_id, selected_option, is_correct in UserResponse.objects.filter(
+                test_session_id__in=batch
+            ).values_list('test_session_id', 'question_id', 'selected_option', 'is_correct')
+        }
+
+        sheets = {}
+        assignments = TestSessionQuestion.objects.filter(test_session_id__in=batch).order_by(
+            'test_session_id', 'question__order', 'question_id'
+        ).values_list('test_session_id', 'question_id', 'question__worksheet_id', 'question__worksheet__subject_id')
+        for session_id, question_id, worksheet_id, subject_id in assignments:
+            sheet = sheets.setdefault((session_id, subject_id), {"worksheet_id": worksheet_id, "question_ids": [], "options": [], "bits": 0})
+            selected_option, is_correct = responses.get((session_id, question_id), ('', False))
+            if is_correct:
+                sheet["bits"] |= 1 << len(sheet["question_ids"])
+            sheet["question_ids"].append(question_id)
+            sheet["options"].append(selected_option or '-')
+
+        AnswerSheet.objects.bulk_create([
+            AnswerSheet(
+                test_session_id=session_id,
+                subject_id=subject_id,
+                worksheet_id=sheet["worksheet_id"],
+                question_ids=struct.pack(f'<{len(sheet["question_ids"])}I', *sheet["question_ids"]),
+                selected_options=''.join(sheet["options"]),
+                correct=sheet["bits"].to_bytes((sheet["bits"].bit_length() + 7) // 8, 'little'),
+            )
+            for (session_id, subject_id), sheet in sheets.items()
+        ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('questionBank', '0004_gradingjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnswerSheet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('question_ids', models.BinaryField(default=b'')),
+                ('selected_options', models.TextField(blank=True, default='')),
+                ('correct', models.BinaryField(default=b'')),
+                ('subject', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='questionBank.subject')),
+                ('test_session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='answer_sheets', to='questionBank.testsession')),
+                ('worksheet', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='questionBank.worksheet')),
+            ],
+            options={
+                'unique_together': {('test_session', 'subject')},
+            },
+        ),
+        migrations.RunPython(backfill_answer_sheets, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.0.6 on 2026-10-18 10:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('questionBank', '0005_answersheet'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='answersheet',
+            name='elapsed_ms',
+            field=models.BinaryField(default=b''),
+        ),
+        migrations.AddField(
+            model_name='result',
+            name='median_time',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='result',
+            name='p90_time',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
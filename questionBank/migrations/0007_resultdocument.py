@@ -0,0 +1,24 @@
+# Generated by Django 5.0.6 on 2026-10-18 11:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('questionBank', '0006_question_timings'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResultDocument',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('document', models.JSONField()),
+                ('etag', models.CharField(max_length=64)),
+                ('rendered_at', models.DateTimeField(auto_now=True)),
+                ('test_session', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='result_document', to='questionBank.testsession')),
+            ],
+        ),
+    ]
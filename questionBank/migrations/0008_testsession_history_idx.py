@@ -0,0 +1,19 @@
+# Generated by Django 5.0.6 on 2026-10-18 11:06
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('questionBank', '0007_resultdocument'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='testsession',
+            index=models.Index(fields=['user', 'completed', '-start_time', '-id'], name='testsession_history_idx'),
+        ),
+    ]
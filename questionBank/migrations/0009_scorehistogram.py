@@ -0,0 +1,26 @@
+# Generated by Django 5.0.6 on 2026-10-18 11:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('questionBank', '0008_testsession_history_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScoreHistogram',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(max_length=7)),
+                ('counts', models.BinaryField(default=b'')),
+                ('subject', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='questionBank.subject')),
+            ],
+            options={
+                'unique_together': {('subject', 'period')},
+            },
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.0.6 on 2026-10-18 11:09
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('questionBank', '0009_scorehistogram'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Leaderboard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('week', models.CharField(max_length=8)),
+                ('entries', models.BinaryField(default=b'')),
+                ('subject', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='questionBank.subject')),
+            ],
+            options={
+                'unique_together': {('subject', 'week')},
+            },
+        ),
+    ]
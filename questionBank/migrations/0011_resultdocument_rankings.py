@@ -0,0 +1,27 @@
+# Generated by Django 5.0.6 on 2026-10-18 11:30
+
+from django.db import migrations, models
+
+
+def drop_documents_with_frozen_percentiles(apps, schema_editor):
+    """
+    Documents stored so far embed the percentiles of their grading time and have no
+    rankings. Dropping them lets the results endpoint render them again on first view.
+    """
+    apps.get_model('questionBank', 'ResultDocument').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('questionBank', '0010_leaderboard'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='resultdocument',
+            name='rankings',
+            field=models.JSONField(default=list),
+        ),
+        migrations.RunPython(drop_documents_with_frozen_percentiles, migrations.RunPython.noop),
+    ]
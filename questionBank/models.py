@@ -1,8 +1,10 @@
-from django.db import models
+import heapq
+import struct
+import numpy as np
+from django.db import models, transaction
 from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.db.models import Q
-from random import sample
 
 class Subject(models.Model):
     name = models.CharField(max_length=100, unique=True)
@@ -21,14 +23,19 @@ class UserSubjectPreference(models.Model):
     selected_subjects = models.ManyToManyField(Subject, related_name='user_preferences')
     
     def clean(self):
-        if self.selected_subjects.count() > 4:
+        # Selections can only exist once the preference itself has been saved
+        if self.pk and self.selected_subjects.count() > 4:
             raise ValidationError("You can only select up to 4 subjects including English.")
 
     def save(self, *args, **kwargs):
+        from .subject_registry import get_subject_registry
+
         self.clean()
         super().save(*args, **kwargs)
-        english_subject = Subject.objects.get(name="English")
-        self.selected_subjects.add(english_subject)
+        english_subject_id = get_subject_registry().get_id("English")
+        if english_subject_id is None:
+            raise Subject.DoesNotExist("Subject matching query does not exist.")
+        self.selected_subjects.add(english_subject_id)
 
     def __str__(self):
         return f"{self.user.username}'s subject preferences"
@@ -50,6 +57,26 @@ class Worksheet(models.Model):
     def get_questions(self):
         return self.questions.all()
 
+class WorksheetExposure(models.Model):
+    """
+    Bitmap of the worksheets of a subject already served to a user. Bit i stands for the
+    i-th worksheet of the subject in id order, so picking an unseen paper needs no history query.
+    Deleting a worksheet shifts the later bits down (see signals.realign_worksheet_exposures).
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='worksheet_exposures')
+    subject = models.ForeignKey(Subject, on_delete=models.CASCADE, related_name='worksheet_exposures')
+    seen = models.BinaryField(default=b'')
+
+    class Meta:
+        unique_together = ('user', 'subject')
+
+    def __str__(self):
+        return f"{self.user} exposure to {self.subject.name} worksheets"
+
+    @property
+    def seen_bits(self):
+        return int.from_bytes(self.seen, 'little')
+
 class Question(models.Model):
     OPTION_CHOICES = [
         ('A', 'A'),
@@ -94,6 +121,12 @@ class TestSession(models.Model):
     subjects = models.ManyToManyField(Subject)
     completed = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            # Serves the history endpoint's keyset pages, newest first
+            models.Index(fields=['user', 'completed', '-start_time', '-id'], name='testsession_history_idx'),
+        ]
+
     def __str__(self):  
         return f"TestSession of {self.user} on {self.start_time}"
 
@@ -103,36 +136,73 @@ class TestSession(models.Model):
             return (self.end_time - self.start_time).total_seconds() / 60.0  # Duration in minutes
         return None
 
-    def generate_questions(self):
-        questions = []
-        selected_subjects = list(self.subjects.all())
-        english_subject = Subject.objects.get(name="English")
-        if english_subject not in selected_subjects:
-            selected_subjects.append(english_subject)
-
-        for subject in selected_subjects:
-            worksheets = list(subject.get_worksheets())
-            if not worksheets:
-                continue
-            
-            selected_worksheet = sample(worksheets, 1)[0]
-            worksheet_questions = list(selected_worksheet.get_questions())
-            questions.extend(worksheet_questions)
-
-        self.testsessionquestion_set.all().delete()
-        self.user_responses.all().delete()
+    @classmethod
+    def create_with_questions(cls, user, subject_ids, question_ids):
+        """
+        Create a session, its subjects and its question assignments in one transaction,
+        using a fixed number of statements regardless of question count.
+        Raises Question.DoesNotExist when a question was deleted after the caller's
+        worksheet index was loaded; the index is invalidated so a retry sees the change.
+        """
+        from .worksheet_index import invalidate_worksheet_index
+
+        if Question.objects.filter(id__in=question_ids).count() != len(set(question_ids)):
+            invalidate_worksheet_index()
+            raise Question.DoesNotExist("The paper refers to questions that no longer exist.")
+
+        with transaction.atomic():
+            test_session = cls.objects.create(user=user)
+            SubjectLink = cls.subjects.through
+            SubjectLink.objects.bulk_create([
+                SubjectLink(testsession_id=test_session.id, subject_id=subject_id)
+                for subject_id in subject_ids
+            ])
+            test_session.assign_questions(question_ids)
+        return test_session
+
+    def assign_questions(self, question_ids):
+        """
+        Bulk-insert the session's question rows and one blank AnswerSheet per subject.
+        """
+        from .answer_sheets import build_blank_sheets
 
         TestSessionQuestion.objects.bulk_create([
-            TestSessionQuestion(test_session=self, question=question)
-            for question in questions
+            TestSessionQuestion(test_session=self, question_id=question_id)
+            for question_id in question_ids
         ])
+        AnswerSheet.objects.bulk_create(build_blank_sheets(self, question_ids))
 
-        UserResponse.objects.bulk_create([
-            UserResponse(user=self.user, question=question, test_session=self)
-            for question in questions
-        ])
+    def generate_questions(self):
+        from .exposure import choose_unseen_worksheet, load_exposures, record_exposures
+        from .subject_registry import get_subject_registry
+        from .worksheet_index import get_worksheet_index
+
+        index = get_worksheet_index()
+        exposures = load_exposures(self.user_id)
+        selected_subject_ids = list(self.subjects.values_list('id', flat=True))
+        english_subject_id = get_subject_registry().get_id("English")
+        if english_subject_id is None:
+            raise Subject.DoesNotExist("Subject matching query does not exist.")
+        if english_subject_id not in selected_subject_ids:
+            selected_subject_ids.append(english_subject_id)
+
+        question_ids = []
+        worksheet_ids = []
+        for subject_id in selected_subject_ids:
+            worksheet_id = choose_unseen_worksheet(index, subject_id, exposures.get(subject_id, 0))
+            if worksheet_id is None:
+                continue
+            worksheet_ids.append(worksheet_id)
+            question_ids.extend(index.get_question_ids(worksheet_id))
 
-        return questions
+        with transaction.atomic():
+            self.testsessionquestion_set.all().delete()
+            self.answer_sheets.all().delete()
+            self.assign_questions(question_ids)
+        record_exposures(self.user_id, index, worksheet_ids, exposures)
+
+        questions = Question.objects.in_bulk(question_ids)
+        return [questions[question_id] for question_id in question_ids if question_id in questions]
 
 class TestSessionQuestion(models.Model):
     test_session = models.ForeignKey(TestSession, on_delete=models.CASCADE)
@@ -141,6 +211,119 @@ class TestSessionQuestion(models.Model):
     class Meta:
         unique_together = ('test_session', 'question')
 
+class AnswerSheet(models.Model):
+    """
+    A session's answers to one subject in a single row: the subject's question ids packed
+    as little-endian uint32s, one selected option per question ('-' while unanswered), a
+    bitmap with bit i set when the i-th question was answered correctly, and the time spent
+    on each question in milliseconds as little-endian uint32s (0 when not reported).
+    """
+    BLANK = '-'
+    MAX_ELAPSED_MS = 2 ** 32 - 1
+
+    test_session = models.ForeignKey(TestSession, on_delete=models.CASCADE, related_name='answer_sheets')
+    subject = models.ForeignKey(Subject, on_delete=models.CASCADE)
+    worksheet = models.ForeignKey(Worksheet, on_delete=models.CASCADE, null=True, blank=True)
+    question_ids = models.BinaryField(default=b'')
+    selected_options = models.TextField(blank=True, default='')
+    correct = models.BinaryField(default=b'')
+    elapsed_ms = models.BinaryField(default=b'')
+
+    class Meta:
+        unique_together = ('test_session', 'subject')
+
+    def __str__(self):
+        return f"Answer sheet for {self.subject.name} in session {self.test_session_id}"
+
+    @staticmethod
+    def pack_question_ids(question_ids):
+        return struct.pack(f'<{len(question_ids)}I', *question_ids)
+
+    @property
+    def question_id_list(self):
+        packed = bytes(self.question_ids)
+        return struct.unpack(f'<{len(packed) // 4}I', packed)
+
+    @property
+    def correct_bits(self):
+        return int.from_bytes(bytes(self.correct), 'little')
+
+    @correct_bits.setter
+    def correct_bits(self, bits):
+        self.correct = bits.to_bytes((bits.bit_length() + 7) // 8, 'little')
+
+    @property
+    def elapsed_ms_array(self):
+        """
+        Time spent per question as a numpy array aligned with question_id_list.
+        """
+        elapsed = np.frombuffer(bytes(self.elapsed_ms), dtype='<u4')
+        if len(elapsed) != len(self.selected_options):
+            return np.zeros(len(self.selected_options), dtype='<u4')
+        return elapsed
+
+    def timing_stats(self):
+        """
+        Return (mean, median, p90) seconds per answered question from the recorded timings,
+        or None when no answered question has a timing.
+        """
+        answered = np.frombuffer(self.selected_options.encode(), dtype='u1') != ord(self.BLANK)
+        elapsed = self.elapsed_ms_array[answered]
+        elapsed = elapsed[elapsed > 0] / 1000
+        if not elapsed.size:
+            return None
+        median, p90 = np.percentile(elapsed, [50, 90])
+        return float(elapsed.mean()), float(median), float(p90)
+
+    @property
+    def answered_count(self):
+        return len(self.selected_options) - self.selected_options.count(self.BLANK)
+
+    @property
+    def correct_count(self):
+        return bin(self.correct_bits).count('1')
+
+    def record_answers(self, answers, answer_key, elapsed_ms=None):
+        """
+        Write the answers to questions on this sheet, marking correctness against the
+        answer key, along with any {question_id: milliseconds} timings reported for them.
+        Returns the ids of the questions written.
+        """
+        options = list(self.selected_options)
+        bits = self.correct_bits
+        elapsed = self.elapsed_ms_array.copy()
+        elapsed_ms = elapsed_ms or {}
+        written = set()
+        for position, question_id in enumerate(self.question_id_list):
+            option = answers.get(question_id)
+            if option is None:
+                continue
+            options[position] = option
+            if question_id in elapsed_ms:
+                elapsed[position] = min(max(int(elapsed_ms[question_id]), 0), self.MAX_ELAPSED_MS)
+            if option == answer_key.get(question_id):
+                bits |= 1 << position
+            else:
+                bits &= ~(1 << position)
+            written.add(question_id)
+        self.selected_options = ''.join(options)
+        self.correct_bits = bits
+        if elapsed.any():
+            self.elapsed_ms = elapsed.tobytes()
+        return written
+
+    def grade(self, answer_key):
+        """
+        Recompute the correctness bitmap against the answer key. Returns True if it changed.
+        """
+        bits = 0
+        for position, (question_id, option) in enumerate(zip(self.question_id_list, self.selected_options)):
+            if option != self.BLANK and option == answer_key.get(question_id):
+                bits |= 1 << position
+        changed = bits != self.correct_bits
+        self.correct_bits = bits
+        return changed
+
 class UserResponse(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     question = models.ForeignKey(Question, on_delete=models.CASCADE)
@@ -149,6 +332,9 @@ class UserResponse(models.Model):
     test_session = models.ForeignKey(TestSession, on_delete=models.CASCADE, related_name='user_responses')
     is_correct = models.BooleanField(default=False)  
 
+    class Meta:
+        unique_together = ('test_session', 'question')
+
     def __str__(self):
         return f"Response by {self.user.username} for question {self.question.id}"
 
@@ -162,6 +348,8 @@ class Result(models.Model):
     worksheet = models.ForeignKey(Worksheet, on_delete=models.CASCADE)
     score = models.FloatField()
     speed = models.FloatField()  # in seconds
+    median_time = models.FloatField(null=True, blank=True)  # seconds per question
+    p90_time = models.FloatField(null=True, blank=True)  # seconds per question
     timestamp = models.DateTimeField(auto_now_add=True)
     test_session = models.ForeignKey(TestSession, on_delete=models.CASCADE, related_name='session_results')
 
@@ -169,19 +357,160 @@ class Result(models.Model):
         return f"Result for {self.user.username} in {self.subject.name} - {self.worksheet.name}"
 
     def calculate_score(self):
-        user_responses = self.test_session.user_responses.filter(question__worksheet__subject=self.subject)
-        correct_responses_count = user_responses.filter(is_correct=True).count()
-        total_questions = user_responses.count()
-        self.score = (correct_responses_count / total_questions) * 100 if total_questions > 0 else 0
+        sheet = self.test_session.answer_sheets.filter(subject=self.subject).first()
+        total_questions = len(sheet.selected_options) if sheet else 0
+        self.score = (sheet.correct_count / total_questions) * 100 if total_questions > 0 else 0
         self.save()
 
     def calculate_speed(self):
-        total_responses = self.test_session.user_responses.count()
-        self.speed = (self.test_session.duration * 60) / total_responses if total_responses > 0 else 0
+        sheet = self.test_session.answer_sheets.filter(subject=self.subject).first()
+        stats = sheet.timing_stats() if sheet else None
+        if stats:
+            self.speed, self.median_time, self.p90_time = stats
+        else:
+            # No per-question timings reported; spread the session duration over its answers
+            total_responses = sum(sheet.answered_count for sheet in self.test_session.answer_sheets.only('selected_options'))
+            self.speed = (self.test_session.duration * 60) / total_responses if total_responses > 0 else 0
         self.save()
 
     def get_failed_questions(self):
-        return self.test_session.user_responses.filter(
-            question__worksheet__subject=self.subject,
-            is_correct=False
-        )
\ No newline at end of file
+        from .answer_sheets import get_session_responses
+
+        return [
+            response for response in get_session_responses(self.test_session, subject_id=self.subject_id)
+            if not response.is_correct
+        ]
+
+class GradingJob(models.Model):
+    """
+    A submitted test session waiting to be graded by the `grade_sessions` worker.
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    test_session = models.OneToOneField(TestSession, on_delete=models.CASCADE, related_name='grading_job')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING, db_index=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Grading of session {self.test_session_id} ({self.status})"
+
+class ResultDocument(models.Model):
+    """
+    The results document of a graded test session, rendered once at grading time and
+    served unchanged by the results endpoint. `etag` is a hash of the rendered JSON.
+    `rankings` holds a [subject name, subject id, score, month graded] entry per Result,
+    so the percentiles, which move as others are graded, are looked up when it is served.
+    """
+    test_session = models.OneToOneField(TestSession, on_delete=models.CASCADE, related_name='result_document')
+    document = models.JSONField()
+    etag = models.CharField(max_length=64)
+    rankings = models.JSONField(default=list)
+    rendered_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Results document of session {self.test_session_id}"
+
+class ScoreHistogram(models.Model):
+    """
+    How many graded Results of a subject fell in each whole-percent score bucket (0-100),
+    for all time or for one calendar month ('YYYY-MM'), as little-endian uint32 counters.
+    """
+    BUCKETS = 101
+    ALL_TIME = 'all'
+
+    subject = models.ForeignKey(Subject, on_delete=models.CASCADE)
+    period = models.CharField(max_length=7)
+    counts = models.BinaryField(default=b'')
+
+    class Meta:
+        unique_together = ('subject', 'period')
+
+    def __str__(self):
+        return f"Score histogram for {self.subject_id} ({self.period})"
+
+    @classmethod
+    def bucket(cls, score):
+        return min(max(int(score), 0), cls.BUCKETS - 1)
+
+    @property
+    def counts_array(self):
+        counts = np.frombuffer(bytes(self.counts), dtype='<u4')
+        if len(counts) != self.BUCKETS:
+            return np.zeros(self.BUCKETS, dtype='<u4')
+        return counts
+
+    @counts_array.setter
+    def counts_array(self, counts):
+        self.counts = counts.astype('<u4').tobytes()
+
+    def add_scores(self, added=(), removed=()):
+        counts = self.counts_array.astype(np.int64)
+        counts += np.bincount([self.bucket(score) for score in added], minlength=self.BUCKETS)
+        counts -= np.bincount([self.bucket(score) for score in removed], minlength=self.BUCKETS)
+        self.counts_array = np.clip(counts, 0, None)
+
+    def percentile(self, score):
+        """
+        Percentage of counted scores in lower buckets than `score`, or None when empty.
+        """
+        counts = self.counts_array
+        total = int(counts.sum())
+        if not total:
+            return None
+        return round(int(counts[:self.bucket(score)].sum()) / total * 100)
+
+class Leaderboard(models.Model):
+    """
+    The best candidates of one subject in one ISO week ('YYYY-Www'): at most
+    LEADERBOARD_SIZE (score, speed, user id) entries packed as little-endian
+    float32/float32/uint32 records, best first and one per user.
+    """
+    ENTRY = struct.Struct('<ffI')
+
+    subject = models.ForeignKey(Subject, on_delete=models.CASCADE)
+    week = models.CharField(max_length=8)
+    entries = models.BinaryField(default=b'')
+
+    class Meta:
+        unique_together = ('subject', 'week')
+
+    def __str__(self):
+        return f"Leaderboard for {self.subject_id} ({self.week})"
+
+    @property
+    def entry_list(self):
+        return list(self.ENTRY.iter_unpack(bytes(self.entries)))
+
+    @entry_list.setter
+    def entry_list(self, entries):
+        self.entries = b''.join(self.ENTRY.pack(*entry) for entry in entries)
+
+    def add_entries(self, entries, size):
+        """
+        Merge (score, speed, user_id) entries in, keeping each user's best and the top
+        `size`: higher score first, then faster speed.
+        """
+        # Round new entries through the packed format so they compare like stored ones
+        entries = [self.ENTRY.unpack(self.ENTRY.pack(*entry)) for entry in entries]
+        best = {}
+        for entry in self.entry_list + entries:
+            if entry[2] not in best or _leaderboard_rank(entry) < _leaderboard_rank(best[entry[2]]):
+                best[entry[2]] = entry
+        self.entry_list = heapq.nsmallest(size, best.values(), key=_leaderboard_rank)
+
+def _leaderboard_rank(entry):
+    score, speed, user_id = entry
+    return -score, speed, user_id
@@ -0,0 +1,154 @@
+from collections import Counter
+from django.core.cache import cache
+from .models import UserSubjectPreference
+from .cache_utils import get_worksheet_payloads
+from .exposure import choose_unseen_worksheet, has_unseen, is_seen
+from .worksheet_index import get_worksheet_index
+
+PAPER_POOL_TTL = 60 * 60 * 12  # 12 hours
+
+def combination_key(subject_ids):
+    return '-'.join(str(subject_id) for subject_id in sorted(subject_ids))
+
+def _pool_keys(combination):
+    return f'paper_pool_{combination}_head', f'paper_pool_{combination}_tail'
+
+def _slot_key(combination, position):
+    return f'paper_pool_{combination}_{position}'
+
+def _assemble_paper(index, picks):
+    """
+    Render a paper from [(subject_id, subject_name, worksheet_id)] picks in subject id order.
+    """
+    payloads = get_worksheet_payloads([worksheet_id for _, _, worksheet_id in picks if worksheet_id is not None])
+
+    rendered_subjects = []
+    manifest = []
+    for subject_id, subject_name, worksheet_id in picks:
+        payload = payloads.get(worksheet_id)
+        manifest.append({
+            "id": subject_id,
+            "name": subject_name,
+            "worksheet_id": worksheet_id,
+            "worksheet_title": payload['worksheet']['worksheet_title'] if payload else "No worksheets available",
+            "question_ids": list(index.get_question_ids(worksheet_id)),
+            "content_hash": payload['content_hash'] if payload else None,
+        })
+        if payload is not None:
+            subject_data = dict(payload['subject'])
+            subject_data['worksheets'] = [payload['worksheet']]
+        else:
+            subject_data = {"id": subject_id, "name": subject_name}
+            subject_data['worksheets'] = [{
+                "worksheet_id": None,
+                "worksheet_title": "No worksheets available",
+                "questions": []
+            }]
+        rendered_subjects.append(subject_data)
+
+    return {
+        "index_version": index.version,
+        "subject_ids": [subject_id for subject_id, _, _ in picks],
+        "worksheet_ids": [worksheet_id for _, _, worksheet_id in picks],
+        "question_ids": [
+            question_id
+            for _, _, worksheet_id in picks
+            for question_id in index.get_question_ids(worksheet_id)
+        ],
+        "subjects": rendered_subjects,
+        "manifest": manifest,
+    }
+
+def build_paper(subjects, exposures=None):
+    """
+    Choose a worksheet per subject and render the exam payload for it, along with
+    a manifest of worksheet ids, question ids and content hashes.
+    `subjects` are Subject instances; the paper lists them in id order. With the user's
+    `exposures` bitmaps, worksheets the user has not seen yet are preferred.
+    """
+    index = get_worksheet_index()
+    exposures = exposures or {}
+    picks = [
+        (subject.id, subject.name, choose_unseen_worksheet(index, subject.id, exposures.get(subject.id, 0)))
+        for subject in sorted(subjects, key=lambda subject: subject.id)
+    ]
+    return _assemble_paper(index, picks)
+
+def personalize_paper(paper, exposures):
+    """
+    Swap out the worksheets of a pooled paper the user has already seen, when the subject
+    still has unseen ones. Subjects that need no swap keep their pre-rendered payload.
+    """
+    index = get_worksheet_index()
+    picks = []
+    changed = False
+    for entry in paper["manifest"]:
+        worksheet_id = entry["worksheet_id"]
+        seen_bits = exposures.get(entry["id"], 0)
+        if worksheet_id is not None and is_seen(index, worksheet_id, seen_bits) and has_unseen(index, entry["id"], seen_bits):
+            worksheet_id = choose_unseen_worksheet(index, entry["id"], seen_bits)
+            changed = True
+        picks.append((entry["id"], entry["name"], worksheet_id))
+
+    return _assemble_paper(index, picks) if changed else paper
+
+def claim_paper(subject_ids):
+    """
+    Take one ready-made paper for the subject combination off its pool.
+    Returns None when the pool is empty or the paper predates the current worksheet index.
+    """
+    combination = combination_key(subject_ids)
+    head_key, _ = _pool_keys(combination)
+    try:
+        position = cache.incr(head_key)
+    except ValueError:
+        return None
+
+    slot_key = _slot_key(combination, position)
+    paper = cache.get(slot_key)
+    if paper is None:
+        return None
+    cache.delete(slot_key)
+
+    if paper["index_version"] != get_worksheet_index().version:
+        return None
+    return paper
+
+def pool_depth(subject_ids):
+    head_key, tail_key = _pool_keys(combination_key(subject_ids))
+    positions = cache.get_many([head_key, tail_key])
+    return max(positions.get(tail_key, 0) - positions.get(head_key, 0), 0)
+
+def refill_pool(subjects, size):
+    """
+    Top the pool for this subject combination up to `size` papers and return its depth.
+    Meant for a single refilling process; claims may run concurrently.
+    """
+    combination = combination_key([subject.id for subject in subjects])
+    head_key, tail_key = _pool_keys(combination)
+    cache.add(head_key, 0, timeout=None)
+    cache.add(tail_key, 0, timeout=None)
+
+    head = cache.get(head_key, 0)
+    # Claims against an empty pool move the head past the tail
+    tail = max(cache.get(tail_key, 0), head)
+    missing = max(size - (tail - head), 0)
+
+    cache.set_many(
+        {_slot_key(combination, tail + offset): build_paper(subjects) for offset in range(1, missing + 1)},
+        timeout=PAPER_POOL_TTL
+    )
+    cache.set(tail_key, tail + missing, timeout=None)
+    return tail + missing - head
+
+def get_popular_combinations(limit):
+    """
+    Return the most common subject id combinations among users' subject preferences.
+    """
+    Selection = UserSubjectPreference.selected_subjects.through
+    selections = {}
+    for preference_id, subject_id in Selection.objects.values_list('usersubjectpreference_id', 'subject_id'):
+        selections.setdefault(preference_id, set()).add(subject_id)
+
+    combinations = Counter(tuple(sorted(subject_ids)) for subject_ids in selections.values())
+    return [subject_ids for subject_ids, _ in combinations.most_common(limit)]
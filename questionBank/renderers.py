@@ -0,0 +1,20 @@
+import msgpack
+from rest_framework import renderers
+from rest_framework.utils.encoders import JSONEncoder
+
+
+class MessagePackRenderer(renderers.BaseRenderer):
+    """
+    Renders responses as MessagePack, a binary encoding of the same data as JSON
+    that is several times smaller for question payloads.
+    """
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        # Dates, decimals, lazy strings etc. are converted the way the JSON renderer does
+        return msgpack.packb(data, default=JSONEncoder().default, use_bin_type=True)
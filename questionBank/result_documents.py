@@ -0,0 +1,163 @@
+import hashlib
+import json
+from django.db import transaction
+from rest_framework.utils.encoders import JSONEncoder
+from .answer_sheets import sheet_responses
+from .cache_utils import cache_test_results, get_cached_test_results
+from .models import GradingJob, Question, ResultDocument, ScoreHistogram
+from .score_histograms import get_score_histograms, score_period
+from .serializers import QuestionSerializer, UserResponseSerializer
+
+
+def render_result_documents(test_sessions, sheets, results):
+    """
+    Render the results document of each session from its graded answer sheets and its
+    Result rows (with their subjects loaded). The failed questions of every session are
+    loaded together in one joined query. Percentiles are left out, since they move as
+    others are graded; the rankings returned alongside let rank_results() add them.
+    Returns {test_session_id: (etag, JSON text, rankings)}.
+    """
+    sessions = {test_session.id: test_session for test_session in test_sessions}
+    subjects = {session_id: [] for session_id in sessions}
+    responses = {session_id: [] for session_id in sessions}
+    for sheet in sheets:
+        subjects[sheet.test_session_id].append(sheet.subject.name)
+        responses[sheet.test_session_id].extend(sheet_responses(sessions[sheet.test_session_id], sheet))
+    results_by_session = {session_id: [] for session_id in sessions}
+    for result in results:
+        results_by_session[result.test_session_id].append(result)
+
+    questions = Question.objects.select_related('worksheet__subject').in_bulk({
+        response.question_id
+        for session_responses in responses.values()
+        for response in session_responses
+        if response.answered and not response.is_correct
+    })
+
+    rendered = {}
+    for session_id, test_session in sessions.items():
+        document_json = _dump({
+            "test_session_id": session_id,
+            "subjects": subjects[session_id],
+            "start_time": test_session.start_time,
+            "end_time": test_session.end_time,
+            "score": test_session.score,
+            "results": [
+                {
+                    "subject": result.subject.name,
+                    "score": result.score,
+                    "speed": result.speed,
+                    "median_time": result.median_time,
+                    "p90_time": result.p90_time,
+                }
+                for result in results_by_session[session_id]
+            ],
+            # Failed questions grouped by subject
+            "failed_questions_by_subject": _get_failed_questions_by_subject(
+                subjects[session_id], responses[session_id], questions
+            ),
+        })
+        rankings = [
+            [result.subject.name, result.subject_id, result.score, score_period(result.timestamp)]
+            for result in results_by_session[session_id]
+        ]
+        rendered[session_id] = (hashlib.sha256(document_json.encode()).hexdigest()[:32], document_json, rankings)
+    return rendered
+
+def store_result_documents(test_sessions, rendered):
+    """
+    Save rendered documents in one statement, replacing earlier ones, and cache them
+    once the surrounding transaction commits.
+    """
+    ResultDocument.objects.bulk_create(
+        [
+            ResultDocument(test_session_id=session_id, document=json.loads(document_json), etag=etag, rankings=rankings)
+            for session_id, (etag, document_json, rankings) in rendered.items()
+        ],
+        update_conflicts=True,
+        unique_fields=['test_session'],
+        update_fields=['document', 'etag', 'rankings', 'rendered_at'],
+    )
+    user_ids = {test_session.id: test_session.user_id for test_session in test_sessions}
+    documents = {(user_ids[session_id], session_id): document for session_id, document in rendered.items()}
+    transaction.on_commit(lambda: cache_test_results(documents))
+
+def get_result_document(user_id, test_session_id):
+    """
+    Return the stored (etag, JSON text, rankings) of one of the user's graded sessions,
+    from the cache or else the database, or None when no document has been stored.
+    """
+    document = get_cached_test_results(user_id, test_session_id)
+    if document is None:
+        stored = ResultDocument.objects.filter(
+            test_session_id=test_session_id, test_session__user_id=user_id
+        ).only('document', 'etag', 'rankings').first()
+        if stored is None:
+            return None
+        document = (stored.etag, _dump(stored.document), stored.rankings)
+        cache_test_results({(user_id, test_session_id): document})
+    return document
+
+def build_result_document(test_session):
+    """
+    Render the document of a completed session that has none stored: one graded before
+    documents existed, or one still waiting for the grading worker. Only the former is
+    stored, since the latter changes once it is graded. Returns (etag, JSON text, rankings).
+    """
+    sheets = list(test_session.answer_sheets.select_related('subject').order_by('id'))
+    results = list(test_session.session_results.select_related('subject').order_by('id'))
+    rendered = render_result_documents([test_session], sheets, results)
+    if not GradingJob.objects.filter(test_session=test_session).exclude(status=GradingJob.DONE).exists():
+        store_result_documents([test_session], rendered)
+    return rendered[test_session.id]
+
+def rank_results(rankings):
+    """
+    Return {subject name: {"percentile": ..., "monthly_percentile": ...}}: the share of
+    candidates who scored lower than each result, over all time and in the month graded,
+    from the current score histograms. Costs one cache lookup when they are warm.
+    """
+    histograms = get_score_histograms(
+        key for _, subject_id, _, period in rankings for key in ((subject_id, ScoreHistogram.ALL_TIME), (subject_id, period))
+    )
+    return {
+        name: {
+            "percentile": histograms[(subject_id, ScoreHistogram.ALL_TIME)].percentile(score),
+            "monthly_percentile": histograms[(subject_id, period)].percentile(score),
+        }
+        for name, subject_id, score, period in rankings
+    }
+
+def with_percentiles(etag, document_json, rankings):
+    """
+    Append the current percentiles to a rendered document as a top-level "percentiles"
+    member, without parsing the document itself. Returns (etag, JSON text), the etag
+    covering both the document and the percentiles, so it moves whenever they do.
+    """
+    percentiles_json = _dump(rank_results(rankings))
+    etag = hashlib.sha256(f'{etag}{percentiles_json}'.encode()).hexdigest()[:32]
+    return etag, f'{document_json[:-1]},"percentiles":{percentiles_json}}}'
+
+def _get_failed_questions_by_subject(subject_names, session_responses, questions):
+    """
+    Build a dictionary of failed questions grouped by subject.
+    Each entry will contain the failed question, the user's incorrect response,
+    and the correct option for that question.
+    """
+    failed_questions_by_subject = {name: [] for name in subject_names}
+    for user_response in session_responses:
+        if not user_response.answered or user_response.is_correct:
+            continue
+        question = questions.get(user_response.question_id)
+        if question is None:
+            continue
+        failed_questions_by_subject.setdefault(question.worksheet.subject.name, []).append({
+            "question": QuestionSerializer(question).data,
+            "user_response": UserResponseSerializer(user_response).data,
+            "correct_option": question.correct_option
+        })
+    return failed_questions_by_subject
+
+def _dump(document):
+    # Same output as the API's JSON renderer, so stored and live documents match
+    return json.dumps(document, cls=JSONEncoder, ensure_ascii=False, separators=(',', ':'))
@@ -0,0 +1,101 @@
+import numpy as np
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from .models import Result, ScoreHistogram
+from .utils import update_subject_rows
+
+HISTOGRAM_CACHE_TTL = 60 * 60 * 24  # 1 day; rewritten whenever grading changes a histogram
+
+
+def score_period(moment):
+    return timezone.localtime(moment).strftime('%Y-%m')
+
+def histogram_keys(subject_id, moment):
+    # The all-time and monthly histograms a score graded at `moment` is counted in
+    return [(subject_id, ScoreHistogram.ALL_TIME), (subject_id, score_period(moment))]
+
+def record_scores(added, removed=()):
+    """
+    Count graded scores into their subject's histograms. `added` and `removed` hold
+    (subject_id, score, graded_at) entries; removed ones are scores replaced by a regrade.
+    The histograms are created, locked and written back in three statements however many
+    scores change, and cached once the surrounding transaction commits.
+    Returns the updated histograms by (subject_id, period).
+    """
+    changes = {}
+    for removing, entries in ((0, added), (1, removed)):
+        for subject_id, score, graded_at in entries:
+            for key in histogram_keys(subject_id, graded_at):
+                changes.setdefault(key, ([], []))[removing].append(score)
+    if not changes:
+        return {}
+
+    histograms = update_subject_rows(
+        ScoreHistogram, 'period', changes, lambda histogram, scores: histogram.add_scores(*scores), ['counts']
+    )
+
+    transaction.on_commit(lambda: _cache_histograms(histograms.values()))
+    return histograms
+
+def get_score_histograms(keys):
+    """
+    Return the histograms for (subject_id, period) keys, from the cache where possible and
+    with one query for the rest. Keys with no histogram yet map to an empty one.
+    """
+    keys = set(keys)
+    cached = cache.get_many([_cache_key(*key) for key in keys])
+    histograms = {}
+    missing = set()
+    for subject_id, period in keys:
+        counts = cached.get(_cache_key(subject_id, period))
+        if counts is None:
+            missing.add((subject_id, period))
+        else:
+            histograms[(subject_id, period)] = ScoreHistogram(subject_id=subject_id, period=period, counts=counts)
+
+    if missing:
+        stored = {
+            (histogram.subject_id, histogram.period): histogram
+            for histogram in ScoreHistogram.objects.filter(
+                subject_id__in={subject_id for subject_id, _ in missing},
+                period__in={period for _, period in missing},
+            )
+        }
+        for subject_id, period in missing:
+            histograms[(subject_id, period)] = stored.get(
+                (subject_id, period), ScoreHistogram(subject_id=subject_id, period=period)
+            )
+        _cache_histograms(histograms[key] for key in missing)
+    return histograms
+
+def rebuild_score_histograms():
+    """
+    Recount every histogram from the Result table and replace the stored ones.
+    Returns the number of histograms written.
+    """
+    counts = {}
+    for subject_id, score, graded_at in Result.objects.values_list('subject_id', 'score', 'timestamp').iterator():
+        for key in histogram_keys(subject_id, graded_at):
+            counts.setdefault(key, np.zeros(ScoreHistogram.BUCKETS, dtype='<u4'))[ScoreHistogram.bucket(score)] += 1
+
+    histograms = [
+        ScoreHistogram(subject_id=subject_id, period=period, counts=bucket_counts.tobytes())
+        for (subject_id, period), bucket_counts in counts.items()
+    ]
+    with transaction.atomic():
+        stale_keys = [_cache_key(*key) for key in ScoreHistogram.objects.values_list('subject_id', 'period')]
+        ScoreHistogram.objects.all().delete()
+        ScoreHistogram.objects.bulk_create(histograms)
+
+    cache.delete_many(stale_keys)
+    _cache_histograms(histograms)
+    return len(histograms)
+
+def _cache_key(subject_id, period):
+    return f'score_histogram_{subject_id}_{period}'
+
+def _cache_histograms(histograms):
+    cache.set_many({
+        _cache_key(histogram.subject_id, histogram.period): bytes(histogram.counts) for histogram in histograms
+    }, timeout=HISTOGRAM_CACHE_TTL)
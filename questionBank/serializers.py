@@ -35,8 +35,9 @@ class TestSessionSerializer(serializers.ModelSerializer):
         fields = ['id', 'start_time', 'end_time', 'score', 'completed', 'questions']
 
     def get_questions(self, obj):
-        user_responses = UserResponse.objects.filter(test_session=obj)
-        return QuestionSerializer([response.question for response in user_responses], many=True).data
+        from .answer_sheets import get_session_responses
+
+        return QuestionSerializer([response.question for response in get_session_responses(obj)], many=True).data
 
 
 class UserResponseSerializer(serializers.ModelSerializer):
@@ -77,4 +78,4 @@ class UserResponseSerializer(serializers.ModelSerializer):
 class ResultSerializer(serializers.ModelSerializer):
     class Meta:
         model = Result
-        fields = ['id', 'subject', 'worksheet', 'score', 'speed', 'timestamp']
+        fields = ['id', 'subject', 'worksheet', 'score', 'speed', 'median_time', 'p90_time', 'timestamp']
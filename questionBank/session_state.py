@@ -0,0 +1,72 @@
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from .grading import VALID_OPTIONS, save_responses
+from .models import TestSession
+
+SESSION_STATE_TTL = 60 * 60 * 6  # 6 hours, comfortably longer than an exam
+
+def _state_key(test_session_id):
+    return f'session_state_{test_session_id}'
+
+def _empty_state():
+    # "pending" holds the question ids whose latest answer is not in the database yet
+    return {"answers": {}, "pending": set(), "revision": 0, "updated_at": None}
+
+def get_session_state(test_session_id):
+    """
+    Return the in-progress answer state of a session, empty if nothing was recorded.
+    """
+    return cache.get(_state_key(test_session_id)) or _empty_state()
+
+def get_pending_answers(state):
+    return {question_id: state["answers"][question_id] for question_id in state["pending"]}
+
+def record_answers(test_session_id, answers, allowed_question_ids=None, persisted=False):
+    """
+    Merge {question_id: selected_option} into the session's cached state without touching
+    the database. Later answers for a question replace earlier ones. Pass `persisted=True`
+    when the caller has already written these answers to the answer sheets. Returns the new state.
+    """
+    state = get_session_state(test_session_id)
+    for question_id, option in answers.items():
+        question_id = int(question_id)
+        # Options are compared as strings; a list or dict sent by a client is simply skipped
+        if not isinstance(option, str) or option not in VALID_OPTIONS:
+            continue
+        if allowed_question_ids is not None and question_id not in allowed_question_ids:
+            continue
+        state["answers"][question_id] = option
+        if persisted:
+            state["pending"].discard(question_id)
+        else:
+            state["pending"].add(question_id)
+
+    state["revision"] += 1
+    state["updated_at"] = timezone.now().isoformat()
+    cache.set(_state_key(test_session_id), state, timeout=SESSION_STATE_TTL)
+    return state
+
+def flush_session_state(test_session):
+    """
+    Write the session's pending cached answers to its answer sheets in one bulk update.
+    The session row is locked first, as submit does, and nothing is written once the
+    session is completed: the submitted answers are final. Returns the ids of the questions written.
+    """
+    with transaction.atomic():
+        if TestSession.objects.select_for_update().filter(id=test_session.id, completed=False).only('id').first() is None:
+            return set()
+
+        # Read under the lock, so a submit that just committed cannot be overwritten by stale state
+        state = cache.get(_state_key(test_session.id))
+        if not state or not state["pending"]:
+            return set()
+
+        saved_question_ids = save_responses(test_session, get_pending_answers(state))
+
+    state["pending"] = set()
+    cache.set(_state_key(test_session.id), state, timeout=SESSION_STATE_TTL)
+    return saved_question_ids
+
+def clear_session_state(test_session_id):
+    cache.delete(_state_key(test_session_id))
@@ -1,12 +1,18 @@
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from django.core.cache import cache
-from .models import Subject,Worksheet, Question, Result
+from .models import Subject,Worksheet, Question, Result, ResultDocument
+from .cache_utils import bump_worksheet_content_version, test_results_cache_key
+from .exposure import drop_worksheet_position
+from .subject_registry import invalidate_subject_registry
+from .worksheet_index import invalidate_worksheet_index
 
 
 @receiver(post_save, sender=Result)
 def invalidate_test_result_cache(sender, instance, **kwargs):
-    cache.delete(f'test_results_user_{instance.user_id}_session_{instance.test_session_id}')
+    # The results endpoint re-renders the document on its next request
+    ResultDocument.objects.filter(test_session_id=instance.test_session_id).delete()
+    cache.delete(test_results_cache_key(instance.user_id, instance.test_session_id))
 
 
 
@@ -16,8 +22,47 @@ def invalidate_test_result_cache(sender, instance, **kwargs):
 @receiver(post_delete, sender=Subject)
 @receiver(post_delete, sender=Worksheet)
 @receiver(post_delete, sender=Question)
-def invalidate_cache(sender, **kwargs):
+def invalidate_cache(sender, instance, **kwargs):
     """
-    Clear the cache when a Subject, Worksheet, or Question is saved or deleted.
+    Drop the cached entries a Subject, Worksheet, or Question change makes stale.
     """
-    cache.clear()
+    if sender is Subject:
+        cache.delete('all_subjects')
+        worksheet_ids = list(Worksheet.objects.filter(subject_id=instance.id).values_list('id', flat=True))
+        if worksheet_ids:
+            bump_worksheet_content_version(*worksheet_ids)
+    elif sender is Worksheet:
+        cache.delete(f'worksheets_{instance.subject_id}')
+        bump_worksheet_content_version(instance.id)
+    else:
+        bump_worksheet_content_version(instance.worksheet_id)
+
+
+@receiver(post_save, sender=Worksheet)
+@receiver(post_save, sender=Question)
+@receiver(post_delete, sender=Worksheet)
+@receiver(post_delete, sender=Question)
+def refresh_worksheet_index(sender, **kwargs):
+    """
+    Publish a new worksheet index version so every worker reloads it on next use.
+    """
+    invalidate_worksheet_index()
+
+
+@receiver(post_delete, sender=Worksheet)
+def realign_worksheet_exposures(sender, instance, **kwargs):
+    """
+    Exposure bits are positions in the subject's worksheet id order; shift them past the deleted one.
+    """
+    position = Worksheet.objects.filter(subject_id=instance.subject_id, id__lt=instance.id).count()
+    drop_worksheet_position(instance.subject_id, position)
+
+
+@receiver(post_save, sender=Subject)
+@receiver(post_delete, sender=Subject)
+def refresh_subject_registry(sender, **kwargs):
+    """
+    Publish a new subject registry version so every worker reloads it on next use.
+    """
+    invalidate_subject_registry()
+
@@ -0,0 +1,53 @@
+from types import MappingProxyType
+from .models import Subject
+from .cache_utils import SharedSnapshot
+
+REGISTRY_VERSION_KEY = 'subject_registry_version'
+
+
+class SubjectRegistry:
+    """
+    Immutable, process-resident name <-> id map of all subjects.
+    """
+
+    def __init__(self, version, subjects):
+        self.version = version
+        self.ids_by_name = MappingProxyType({name: subject_id for subject_id, name in subjects})
+        self.names_by_id = MappingProxyType({subject_id: name for subject_id, name in subjects})
+
+    @classmethod
+    def load(cls, version):
+        return cls(version, list(Subject.objects.values_list('id', 'name')))
+
+    def get_id(self, name):
+        return self.ids_by_name.get(name)
+
+    def get_name(self, subject_id):
+        return self.names_by_id.get(subject_id)
+
+    def resolve(self, names):
+        """
+        Return the ids of the named subjects, or None if any name is unknown.
+        """
+        subject_ids = [self.ids_by_name.get(name) for name in names]
+        return None if None in subject_ids else subject_ids
+
+    def get_subjects(self, subject_ids):
+        """
+        Build unsaved Subject instances carrying id and name, without a query.
+        """
+        return [Subject(id=subject_id, name=self.names_by_id[subject_id]) for subject_id in subject_ids]
+
+
+_registry = SharedSnapshot(REGISTRY_VERSION_KEY, SubjectRegistry.load)
+
+
+def get_subject_registry():
+    """
+    Return this worker's registry, loading it on first use and whenever the shared version moves.
+    """
+    return _registry.get()
+
+
+def invalidate_subject_registry():
+    _registry.invalidate()
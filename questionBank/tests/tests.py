@@ -1,11 +1,32 @@
 from django.urls import reverse
 from rest_framework import status
 from django.contrib.auth import get_user_model
-from ..models import Subject, TestSession, Question, Worksheet, TestSessionQuestion, UserResponse, Result, UserSubjectPreference
-from .utilis import BaseTestCase
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.test import override_settings
+from django.utils import timezone
+from io import StringIO
+from unittest import mock
+import msgpack
+from ..models import Subject, TestSession, Question, Worksheet, TestSessionQuestion, UserResponse, Result, UserSubjectPreference, WorksheetExposure, GradingJob, AnswerSheet, ResultDocument, ScoreHistogram, Leaderboard
+from PerformanceApp.models import PerformanceRecord
+from .utilis import BaseTestCase, create_exam_fixture
+from ..worksheet_index import WorksheetIndex, get_worksheet_index
+from ..cache_utils import get_answer_keys, get_worksheet_payloads
+from ..paper_pool import claim_paper, pool_depth, refill_pool
+from ..subject_registry import get_subject_registry
+from ..grading import grade_test_sessions, load_answer_key, save_responses
+from ..leaderboards import leaderboard_week, record_leaderboard_results
+from ..answer_sheets import get_session_responses
+from ..session_state import flush_session_state, record_answers
+from ..exposure import load_exposures
+from ..views.submitTestSession_view import SubmitTestSessionView
 
 User = get_user_model()
 
+def answered_responses(test_session):
+    return [response for response in get_session_responses(test_session, load_questions=False) if response.answered]
+
 class StartTestSessionViewTests(BaseTestCase):
 
     @classmethod
@@ -59,7 +80,7 @@ class SubmitTestSessionViewTests(BaseTestCase):
         cls.test_session.subjects.add(cls.english, cls.math, cls.science)
         cls.worksheet = Worksheet.objects.create(subject=cls.english, name="Worksheet 1")
         cls.question = Question.objects.create(worksheet=cls.worksheet, text="What is 2+2?", correct_option='A')
-        TestSessionQuestion.objects.create(test_session=cls.test_session, question=cls.question)
+        cls.test_session.assign_questions([cls.question.id])
         cls.client.force_authenticate(user=cls.user)
 
     def test_submit_test_session(self):
@@ -72,8 +93,10 @@ class SubmitTestSessionViewTests(BaseTestCase):
         self.log_request_response('POST', url, data, response)
 
         try:
-            self.assertEqual(response.status_code, status.HTTP_200_OK)
-            self.assertTrue(UserResponse.objects.filter(test_session=self.test_session, question=self.question).exists())
+            self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+            sheet = AnswerSheet.objects.get(test_session=self.test_session, subject=self.english)
+            self.assertEqual(sheet.question_id_list, (self.question.id,))
+            self.assertEqual(sheet.selected_options, 'A')
             self.assert_passed("test_submit_test_session")
         except AssertionError as e:
             self.assert_failed("test_submit_test_session", e)
@@ -105,7 +128,7 @@ class SubmitTestSessionViewTests(BaseTestCase):
         self.log_request_response('POST', url, data, response)
 
         try:
-            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
             self.assert_passed("test_submit_test_session_missing_responses")
         except AssertionError as e:
             self.assert_failed("test_submit_test_session_missing_responses", e)
@@ -163,3 +186,1241 @@ class ViewTestSessionResultsViewTests(BaseTestCase):
             self.assert_passed("test_view_test_session_results_invalid_id")
         except AssertionError as e:
             self.assert_failed("test_view_test_session_results_invalid_id", e)
+
+class WorksheetIndexTests(BaseTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.english = Subject.objects.create(name="English")
+        cls.math = Subject.objects.create(name="Math")
+        cls.worksheet = Worksheet.objects.create(subject=cls.english, name="Worksheet 1")
+        cls.second = Question.objects.create(worksheet=cls.worksheet, text="Second", correct_option='B', order=2)
+        cls.first = Question.objects.create(worksheet=cls.worksheet, text="First", correct_option='A', order=1)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_index_orders_questions_per_worksheet(self):
+        index = get_worksheet_index()
+        self.assertEqual(index.get_worksheet_ids(self.english.id), (self.worksheet.id,))
+        self.assertEqual(index.get_question_ids(self.worksheet.id), (self.first.id, self.second.id))
+        self.assertEqual(index.get_worksheet_ids(self.math.id), ())
+
+    def test_warm_index_costs_no_queries(self):
+        get_worksheet_index()
+        with self.assertNumQueries(0):
+            index = get_worksheet_index()
+            index.get_question_ids(self.worksheet.id)
+
+    def test_index_refreshes_on_question_change(self):
+        index = get_worksheet_index()
+        third = Question.objects.create(worksheet=self.worksheet, text="Third", correct_option='C', order=3)
+        refreshed = get_worksheet_index()
+        self.assertNotEqual(index.version, refreshed.version)
+        self.assertEqual(refreshed.get_question_ids(self.worksheet.id)[-1], third.id)
+
+    def test_load_skips_a_worksheet_created_between_its_reads(self):
+        order_questions = Question.objects.order_by
+
+        def create_worksheet_first(*fields):
+            late = Worksheet.objects.create(subject=self.math, name="Late worksheet")
+            Question.objects.create(worksheet=late, text="Late", correct_option='A')
+            return order_questions(*fields)
+
+        with mock.patch.object(Question.objects, 'order_by', side_effect=create_worksheet_first):
+            index = WorksheetIndex.load('version')
+        self.assertEqual(index.get_worksheet_ids(self.math.id), ())
+        self.assertEqual(index.get_question_ids(self.worksheet.id), (self.first.id, self.second.id))
+
+
+class StartTestSessionBulkTests(BaseTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='bulkuser@mail.com', password='password123')
+        cls.subjects = [Subject.objects.create(name=name) for name in ["English", "Math", "Science", "History"]]
+        preference = UserSubjectPreference.objects.create(user=cls.user)
+        preference.selected_subjects.set(cls.subjects)
+        cls.question_ids = []
+        for subject in cls.subjects:
+            worksheet = Worksheet.objects.create(subject=subject, name=f"{subject.name} Worksheet")
+            for order in range(40):
+                question = Question.objects.create(worksheet=worksheet, text=f"Q{order}", correct_option='A', order=order)
+                cls.question_ids.append(question.id)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(user=self.user)
+
+    def test_create_with_questions_uses_fixed_statement_count(self):
+        get_worksheet_index()
+        # questions exist check, SAVEPOINT, session INSERT, subjects INSERT, questions INSERT,
+        # answer sheets INSERT, RELEASE
+        with self.assertNumQueries(7):
+            test_session = TestSession.create_with_questions(
+                self.user, [subject.id for subject in self.subjects], self.question_ids
+            )
+        self.assertEqual(test_session.subjects.count(), 4)
+        self.assertEqual(TestSessionQuestion.objects.filter(test_session=test_session).count(), 160)
+        self.assertEqual(AnswerSheet.objects.filter(test_session=test_session).count(), 4)
+
+    def test_start_test_session_assigns_all_questions(self):
+        url = reverse('start-test-session')
+        data = {'subjects': [subject.name for subject in self.subjects]}
+        response = self.client.post(url, data, format='json')
+        self.log_request_response('POST', url, data, response)
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.data['subjects']), 4)
+        self.assertEqual(sorted(response.data['assigned_question_ids']), sorted(self.question_ids))
+        test_session = TestSession.objects.get(id=response.data['test_session_id'])
+        self.assertEqual(TestSessionQuestion.objects.filter(test_session=test_session).count(), 160)
+
+    def test_start_recovers_from_a_stale_worksheet_index(self):
+        get_worksheet_index()
+        deleted_id = self.question_ids[0]
+        # Deleted elsewhere: this worker's index still lists the question
+        with mock.patch('questionBank.signals.invalidate_worksheet_index'):
+            Question.objects.filter(id=deleted_id).delete()
+
+        response = self.client.post(
+            reverse('start-test-session'), {'subjects': [subject.name for subject in self.subjects]}, format='json'
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertNotIn(deleted_id, response.data['assigned_question_ids'])
+        self.assertEqual(len(response.data['assigned_question_ids']), 159)
+        self.assertEqual(TestSessionQuestion.objects.filter(test_session_id=response.data['test_session_id']).count(), 159)
+
+    def test_generate_questions_adds_blank_answer_sheets(self):
+        test_session = TestSession.objects.create(user=self.user)
+        test_session.subjects.set(self.subjects[1:])
+        questions = test_session.generate_questions()
+        self.assertEqual(len(questions), 160)
+        sheets = AnswerSheet.objects.filter(test_session=test_session)
+        self.assertEqual(sheets.count(), 4)
+        self.assertTrue(all(sheet.selected_options == AnswerSheet.BLANK * 40 for sheet in sheets))
+        self.assertFalse(UserResponse.objects.filter(test_session=test_session).exists())
+
+class WorksheetPayloadCacheTests(BaseTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.english = Subject.objects.create(name="English")
+        cls.worksheet = Worksheet.objects.create(subject=cls.english, name="Worksheet 1")
+        cls.question = Question.objects.create(worksheet=cls.worksheet, text="Old text", correct_option='A')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_payload_is_served_from_cache(self):
+        payload = get_worksheet_payloads([self.worksheet.id])[self.worksheet.id]
+        self.assertEqual(payload['subject'], {'id': self.english.id, 'name': "English"})
+        self.assertEqual(payload['worksheet']['questions'][0]['text'], "Old text")
+        with self.assertNumQueries(0):
+            self.assertEqual(get_worksheet_payloads([self.worksheet.id])[self.worksheet.id], payload)
+
+    def test_question_save_invalidates_payload(self):
+        get_worksheet_payloads([self.worksheet.id])
+        self.question.text = "New text"
+        self.question.save()
+        payload = get_worksheet_payloads([self.worksheet.id])[self.worksheet.id]
+        self.assertEqual(payload['worksheet']['questions'][0]['text'], "New text")
+
+class PaperPoolTests(BaseTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='pooluser@mail.com', password='password123')
+        cls.subjects = [Subject.objects.create(name=name) for name in ["English", "Math", "Science", "History"]]
+        preference = UserSubjectPreference.objects.create(user=cls.user)
+        preference.selected_subjects.set(cls.subjects)
+        for subject in cls.subjects:
+            worksheet = Worksheet.objects.create(subject=subject, name=f"{subject.name} Worksheet")
+            Question.objects.create(worksheet=worksheet, text="Q", correct_option='A')
+        cls.subject_ids = [subject.id for subject in cls.subjects]
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(user=self.user)
+
+    def test_claim_from_empty_pool_returns_none(self):
+        self.assertIsNone(claim_paper(self.subject_ids))
+
+    def test_start_claims_a_pooled_paper(self):
+        self.assertEqual(refill_pool(self.subjects, 3), 3)
+        url = reverse('start-test-session')
+        data = {'subjects': [subject.name for subject in self.subjects]}
+        response = self.client.post(url, data, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.data['assigned_question_ids']), 4)
+        self.assertEqual(pool_depth(self.subject_ids), 2)
+
+    def test_stale_paper_is_discarded(self):
+        refill_pool(self.subjects, 1)
+        Question.objects.create(worksheet=Worksheet.objects.first(), text="New", correct_option='B')
+        self.assertIsNone(claim_paper(self.subject_ids))
+
+    def test_refill_command_reports_depth(self):
+        out = StringIO()
+        with mock.patch('questionBank.management.commands.refill_paper_pools.cache_is_shared', return_value=True):
+            call_command('refill_paper_pools', size=2, stdout=out)
+        self.assertIn("2 papers ready", out.getvalue())
+        self.assertEqual(pool_depth(self.subject_ids), 2)
+
+    def test_refill_command_refuses_a_process_local_cache(self):
+        with self.assertRaisesMessage(CommandError, "REDIS_CACHE_URL"):
+            call_command('refill_paper_pools', size=2, stdout=StringIO())
+        self.assertEqual(pool_depth(self.subject_ids), 0)
+
+class IdempotentStartTests(BaseTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='retryuser@mail.com', password='password123')
+        cls.subjects = create_exam_fixture(cls.user, questions_per_worksheet=3)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse('start-test-session')
+        self.data = {'subjects': [subject.name for subject in self.subjects]}
+
+    def test_retry_replays_original_response(self):
+        first = self.client.post(self.url, self.data, format='json', HTTP_IDEMPOTENCY_KEY='start-1')
+        retry = self.client.post(self.url, self.data, format='json', HTTP_IDEMPOTENCY_KEY='start-1')
+
+        self.assertEqual(retry.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry.data['test_session_id'], first.data['test_session_id'])
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(TestSession.objects.filter(user=self.user).count(), 1)
+
+    def test_key_reused_with_different_body_is_rejected(self):
+        self.client.post(self.url, self.data, format='json', HTTP_IDEMPOTENCY_KEY='start-2')
+        response = self.client.post(self.url, {'subjects': ['English']}, format='json', HTTP_IDEMPOTENCY_KEY='start-2')
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+    def test_key_reused_with_different_query_is_rejected(self):
+        self.client.post(self.url, self.data, format='json', HTTP_IDEMPOTENCY_KEY='start-3')
+        response = self.client.post(
+            self.url + '?delivery=manifest', self.data, format='json', HTTP_IDEMPOTENCY_KEY='start-3'
+        )
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+        self.assertEqual(TestSession.objects.filter(user=self.user).count(), 1)
+
+    def test_requests_without_key_are_not_deduplicated(self):
+        self.client.post(self.url, self.data, format='json')
+        self.client.post(self.url, self.data, format='json')
+        self.assertEqual(TestSession.objects.filter(user=self.user).count(), 2)
+
+class ManifestDeliveryTests(BaseTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='manifestuser@mail.com', password='password123')
+        cls.subjects = create_exam_fixture(cls.user, questions_per_worksheet=5)
+
+    def setUp(self):
+        cache.clear()
+        response = self.start_session(delivery='manifest')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.manifest = response.data
+        self.url = reverse('test-session-questions', kwargs={'session_id': self.manifest['test_session_id']})
+
+    def test_start_returns_manifest_without_questions(self):
+        self.assertEqual(self.manifest['delivery'], 'manifest')
+        entry = self.manifest['subjects'][0]
+        self.assertEqual(len(entry['question_ids']), 5)
+        self.assertTrue(entry['content_hash'])
+        self.assertNotIn('worksheets', entry)
+
+    def test_questions_are_paged_with_etag(self):
+        entry = self.manifest['subjects'][0]
+        response = self.client.get(self.url, {'subject': entry['id'], 'page': 1, 'page_size': 2})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([q['id'] for q in response.data['questions']], entry['question_ids'][:2])
+        self.assertIn('immutable', response['Cache-Control'])
+
+        cached = self.client.get(
+            self.url, {'subject': entry['id'], 'page': 1, 'page_size': 2}, HTTP_IF_NONE_MATCH=response['ETag']
+        )
+        self.assertEqual(cached.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_questions_added_after_start_are_not_served(self):
+        entry = self.manifest['subjects'][0]
+        Question.objects.create(worksheet_id=entry['worksheet_id'], text="Late", correct_option='A', order=9)
+
+        response = self.client.get(self.url, {'subject': entry['id']})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([q['id'] for q in response.data['questions']], entry['question_ids'])
+        self.assertEqual(response.data['total_questions'], 5)
+
+    def test_questions_fall_back_to_database_manifest(self):
+        cache.clear()
+        entry = self.manifest['subjects'][1]
+        response = self.client.get(self.url, {'subject': entry['id']})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['total_questions'], 5)
+
+    def test_other_users_cannot_fetch_questions(self):
+        other = User.objects.create_user(email='other@mail.com', password='password123')
+        self.client.force_authenticate(user=other)
+        response = self.client.get(self.url, {'subject': self.manifest['subjects'][0]['id']})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+class SessionStateTests(BaseTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='stateuser@mail.com', password='password123')
+        cls.subjects = create_exam_fixture(cls.user, questions_per_worksheet=2)
+
+    def setUp(self):
+        cache.clear()
+        self.start_session()
+        self.url = reverse('test-session-state', kwargs={'session_id': self.test_session.id})
+
+    def test_answers_stay_in_cache_until_flushed(self):
+        answers = [{'question_id': question_id, 'selected_option': 'B'} for question_id in self.question_ids[:3]]
+        answers.append({'question_id': 999999, 'selected_option': 'A'})  # Not part of the session
+        response = self.client.post(self.url, {'answers': answers}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['answers']), 3)
+        self.assertFalse(answered_responses(self.test_session))
+
+        resumed = self.client.get(self.url)
+        self.assertEqual(len(resumed.data['answers']), 3)
+
+        out = StringIO()
+        call_command('flush_session_states', stdout=out)
+        self.assertIn("Flushed 3 answers from 1 sessions", out.getvalue())
+        self.assertEqual([response.selected_option for response in answered_responses(self.test_session)], ['B'] * 3)
+
+    def test_non_string_options_are_skipped(self):
+        answers = [
+            {'question_id': self.question_ids[0], 'selected_option': ['A']},
+            {'question_id': self.question_ids[1], 'selected_option': {'option': 'A'}},
+            {'question_id': self.question_ids[2], 'selected_option': 'C'},
+        ]
+        response = self.client.post(self.url, {'answers': answers}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['answers']), 1)
+
+    def test_submit_flushes_cached_answers(self):
+        answers = [{'question_id': question_id, 'selected_option': 'A'} for question_id in self.question_ids]
+        self.client.post(self.url, {'answers': answers}, format='json')
+        response = self.client.post(
+            reverse('submit-test-session'), {'test_session_id': self.test_session.id, 'responses': []}, format='json'
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(
+            sum(response.is_correct for response in answered_responses(self.test_session)), len(self.question_ids)
+        )
+
+    def test_sweeper_never_overwrites_submitted_answers(self):
+        self.client.post(reverse('submit-test-session'), {
+            'test_session_id': self.test_session.id,
+            'responses': [{'question_id': question_id, 'selected_option': 'A'} for question_id in self.question_ids],
+        }, format='json')
+        # Stale cached answers the sweeper might still hold once submit has committed
+        record_answers(self.test_session.id, {question_id: 'C' for question_id in self.question_ids})
+
+        self.assertEqual(flush_session_state(self.test_session), set())
+        self.assertEqual({response.selected_option for response in answered_responses(self.test_session)}, {'A'})
+
+class WorksheetExposureTests(BaseTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='exposureuser@mail.com', password='password123')
+        cls.subjects = create_exam_fixture(cls.user)
+        cls.english = cls.subjects[0]
+        for name in ["Worksheet 2", "Worksheet 3"]:
+            worksheet = Worksheet.objects.create(subject=cls.english, name=name)
+            Question.objects.create(worksheet=worksheet, text="Q", correct_option='A')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(user=self.user)
+
+    def _start_english_worksheet(self):
+        response = self.start_session()
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        english = next(entry for entry in response.data['subjects'] if entry['id'] == self.english.id)
+        return english['worksheets'][0]['worksheet_id']
+
+    def test_worksheets_are_not_repeated_until_all_seen(self):
+        served = [self._start_english_worksheet() for _ in range(3)]
+        self.assertEqual(len(set(served)), 3)
+
+        exposure = WorksheetExposure.objects.get(user=self.user, subject=self.english)
+        self.assertEqual(exposure.seen_bits, 0b111)
+
+        # A fourth start begins a new cycle with only the served worksheet marked
+        self._start_english_worksheet()
+        exposure.refresh_from_db()
+        self.assertEqual(bin(exposure.seen_bits).count('1'), 1)
+
+    def test_pooled_paper_is_personalized(self):
+        first = self._start_english_worksheet()
+        refill_pool(self.subjects, 5)
+        for _ in range(2):
+            self.assertNotEqual(self._start_english_worksheet(), first)
+
+    def test_deleting_a_worksheet_realigns_seen_bits(self):
+        first, second, third = Worksheet.objects.filter(subject=self.english).order_by('id')
+        WorksheetExposure.objects.create(user=self.user, subject=self.english, seen=(0b101).to_bytes(1, 'little'))
+
+        second.delete()
+
+        # first and third stay seen, now at positions 0 and 1
+        exposure = WorksheetExposure.objects.get(user=self.user, subject=self.english)
+        self.assertEqual(exposure.seen_bits, 0b11)
+        self.assertEqual(load_exposures(self.user.id)[self.english.id], 0b11)
+
+class SubjectRegistryTests(BaseTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='registryuser@mail.com', password='password123')
+        cls.subjects = create_exam_fixture(cls.user, subject_names=("English", "Math", "Science", "History", "Geography"))
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(user=self.user)
+
+    def test_warm_registry_resolves_without_queries(self):
+        get_subject_registry()
+        with self.assertNumQueries(0):
+            registry = get_subject_registry()
+            self.assertEqual(registry.resolve(["English", "Math"]), [self.subjects[0].id, self.subjects[1].id])
+            self.assertIsNone(registry.resolve(["English", "Alchemy"]))
+
+    def test_registry_refreshes_on_subject_save(self):
+        get_subject_registry()
+        biology = Subject.objects.create(name="Biology")
+        self.assertEqual(get_subject_registry().get_id("Biology"), biology.id)
+
+    def test_set_subject_preferences_always_includes_english(self):
+        UserSubjectPreference.objects.filter(user=self.user).delete()
+        url = reverse('user-subject-preferences')
+        data = {'subjects': ["English", "Math", "Science", "History"]}
+        response = self.client.post(url, data, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        preference = UserSubjectPreference.objects.get(user=self.user)
+        self.assertEqual(
+            set(preference.selected_subjects.values_list('name', flat=True)), {"English", "Math", "Science", "History"}
+        )
+
+    def test_start_rejects_unknown_subjects(self):
+        data = {'subjects': ["English", "Math", "Science", "Alchemy"]}
+        response = self.client.post(reverse('start-test-session'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['error']['code'], "INVALID_SUBJECTS")
+
+class ExamStartAdmissionTests(BaseTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='admissionuser@mail.com', password='password123')
+        cls.subjects = create_exam_fixture(cls.user)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(user=self.user)
+        self.data = {'subjects': [subject.name for subject in self.subjects]}
+
+    @override_settings(EXAM_START_RATE=0, EXAM_START_QUEUE_TIMEOUT=0)
+    def test_start_is_rejected_with_retry_after_when_saturated(self):
+        response = self.client.post(reverse('start-test-session'), self.data, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(response['Retry-After'], str(response.data['error']['details']['retry_after']))
+        self.assertEqual(response.data['error']['details']['queue_position'], 1)
+        self.assertFalse(TestSession.objects.filter(user=self.user).exists())
+
+    @override_settings(EXAM_START_RATE=0, EXAM_START_QUEUE_TIMEOUT=0)
+    def test_rejected_start_is_not_replayed_for_idempotent_retry(self):
+        self.client.post(reverse('start-test-session'), self.data, format='json', HTTP_IDEMPOTENCY_KEY='busy')
+        with override_settings(EXAM_START_RATE=50):
+            response = self.client.post(reverse('start-test-session'), self.data, format='json', HTTP_IDEMPOTENCY_KEY='busy')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+class BulkGradingSubmitTests(BaseTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='gradinguser@mail.com', password='password123')
+        cls.subjects = create_exam_fixture(cls.user, questions_per_worksheet=40)
+
+    def setUp(self):
+        cache.clear()
+        self.start_session()
+
+    def test_submit_grades_all_answers_with_fixed_query_count(self):
+        responses = [
+            {'question_id': question_id, 'selected_option': 'A' if position % 2 else 'B'}
+            for position, question_id in enumerate(self.question_ids)
+        ]
+        url = reverse('submit-test-session')
+        data = {'test_session_id': self.test_session.id, 'responses': responses}
+        # SAVEPOINT, session SELECT FOR UPDATE, completion UPDATE, sheets SELECT FOR UPDATE, sheets UPDATE,
+        # job INSERT, RELEASE; the answer key comes from the cache
+        with self.assertNumQueries(7):
+            response = self.client.post(url, data, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        responses = answered_responses(self.test_session)
+        self.assertEqual(len(responses), 160)
+        self.assertEqual(sum(response.is_correct for response in responses), 80)
+        self.test_session.refresh_from_db()
+        self.assertTrue(self.test_session.completed)
+
+    def test_invalid_responses_are_skipped(self):
+        url = reverse('submit-test-session')
+        data = {'test_session_id': self.test_session.id, 'responses': [
+            {'question_id': self.question_ids[0], 'selected_option': 'A'},
+            {'question_id': self.question_ids[1], 'selected_option': 'Z'},
+            {'question_id': 999999, 'selected_option': 'A'},
+            {'selected_option': 'A'},
+        ]}
+        response = self.client.post(url, data, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(
+            [response.question_id for response in answered_responses(self.test_session)],
+            [self.question_ids[0]]
+        )
+
+class AnswerAutosaveTests(BaseTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='autosaveuser@mail.com', password='password123')
+        cls.subjects = create_exam_fixture(cls.user, questions_per_worksheet=5)
+
+    def setUp(self):
+        cache.clear()
+        self.start_session()
+        self.url = reverse('test-session-answers', kwargs={'session_id': self.test_session.id})
+
+    def test_patch_upserts_answers(self):
+        first = [{'question_id': question_id, 'selected_option': 'B'} for question_id in self.question_ids[:3]]
+        response = self.client.patch(self.url, {'answers': first}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['saved_question_ids'], sorted(self.question_ids[:3]))
+
+        changed = [{'question_id': self.question_ids[0], 'selected_option': 'A'}]
+        self.client.patch(self.url, {'answers': changed}, format='json')
+
+        responses = {response.question_id: response for response in answered_responses(self.test_session)}
+        self.assertEqual(len(responses), 3)
+        self.assertTrue(responses[self.question_ids[0]].is_correct)
+
+    def test_submit_after_autosave_only_finalizes(self):
+        answers = [{'question_id': question_id, 'selected_option': 'A'} for question_id in self.question_ids]
+        self.client.patch(self.url, {'answers': answers}, format='json')
+
+        url = reverse('submit-test-session')
+        data = {'test_session_id': self.test_session.id, 'responses': []}
+        # SAVEPOINT, session SELECT FOR UPDATE, completion UPDATE, job INSERT, RELEASE; no answer key reads or response writes
+        with self.assertNumQueries(5):
+            response = self.client.post(url, data, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(sum(response.is_correct for response in answered_responses(self.test_session)), 20)
+
+    def test_patch_skips_non_string_options(self):
+        answers = [
+            {'question_id': self.question_ids[0], 'selected_option': ['A']},
+            {'question_id': self.question_ids[1], 'selected_option': 'A'},
+        ]
+        response = self.client.patch(self.url, {'answers': answers}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['saved_question_ids'], [self.question_ids[1]])
+        self.assertEqual(save_responses(self.test_session, {self.question_ids[0]: ['A']}), set())
+
+    def test_submit_drops_non_string_options(self):
+        responses = [
+            {'question_id': self.question_ids[0], 'selected_option': ['A']},
+            [self.question_ids[1], {'option': 'A'}],
+            {'question_id': self.question_ids[2], 'selected_option': 'A'},
+        ]
+        response = self.client.post(reverse('submit-test-session'), {
+            'test_session_id': self.test_session.id, 'responses': responses
+        }, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(
+            [response.question_id for response in answered_responses(self.test_session)], [self.question_ids[2]]
+        )
+
+    def test_patch_rejects_completed_session(self):
+        TestSession.objects.filter(id=self.test_session.id).update(completed=True)
+        response = self.client.patch(self.url, {'answers': []}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+class AnswerKeyCacheTests(BaseTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='answerkeyuser@mail.com', password='password123')
+        cls.subjects = create_exam_fixture(cls.user, questions_per_worksheet=4)
+        cls.worksheet = Worksheet.objects.get(subject=cls.subjects[0])
+        cls.questions = list(cls.worksheet.questions.order_by('order'))
+        for question, option in zip(cls.questions, "ABDC"):
+            Question.objects.filter(id=question.id).update(correct_option=option)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_answer_key_is_packed_and_cached(self):
+        question_ids, options = get_answer_keys([self.worksheet.id])[self.worksheet.id]
+        self.assertEqual(question_ids, tuple(question.id for question in self.questions))
+        self.assertEqual(options, "ABDC")
+        with self.assertNumQueries(0):
+            get_answer_keys([self.worksheet.id])
+
+    def test_question_save_invalidates_answer_key(self):
+        get_answer_keys([self.worksheet.id])
+        question = self.questions[0]
+        question.correct_option = 'D'
+        question.save()
+        self.assertEqual(get_answer_keys([self.worksheet.id])[self.worksheet.id][1], "DBDC")
+
+    def test_session_answer_key_needs_no_queries(self):
+        self.start_session()
+        with self.assertNumQueries(0):
+            answer_key = load_answer_key(self.test_session)
+        self.assertEqual(len(answer_key), 16)
+        self.assertEqual(answer_key[self.questions[2].id], 'D')
+
+class GradingWorkerTests(BaseTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='workeruser@mail.com', password='password123')
+        cls.subjects = create_exam_fixture(cls.user, questions_per_worksheet=4)
+
+    def setUp(self):
+        cache.clear()
+        self.start_session()
+
+    def _submit(self, responses):
+        return self.client.post(
+            reverse('submit-test-session'), {'test_session_id': self.test_session.id, 'responses': responses}, format='json'
+        )
+
+    def test_submit_queues_grading(self):
+        response = self._submit([{'question_id': self.question_ids[0], 'selected_option': 'A'}])
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['grading_status'], GradingJob.PENDING)
+        self.assertFalse(Result.objects.filter(test_session=self.test_session).exists())
+
+    def test_worker_materializes_results(self):
+        # Half of each subject answered correctly, one answer wrong, the rest unanswered
+        responses = [{'question_id': question_id, 'selected_option': 'A'} for question_id in self.question_ids[::2]]
+        responses[0]['selected_option'] = 'B'
+        self._submit(responses)
+
+        out = StringIO()
+        call_command('grade_sessions', stdout=out)
+        self.assertIn("Graded 1 sessions, 0 failed", out.getvalue())
+
+        job = GradingJob.objects.get(test_session=self.test_session)
+        self.assertEqual((job.status, job.attempts), (GradingJob.DONE, 1))
+        scores = dict(Result.objects.filter(test_session=self.test_session).values_list('subject__name', 'score'))
+        self.assertEqual(scores, {'English': 25.0, 'Math': 50.0, 'Science': 50.0, 'History': 50.0})
+        self.test_session.refresh_from_db()
+        self.assertEqual(self.test_session.score, 175)
+        self.assertEqual(
+            sorted(PerformanceRecord.objects.filter(user=self.user).values_list('subject__name', 'score')),
+            [('English', 25.0), ('History', 50.0), ('Math', 50.0), ('Science', 50.0)]
+        )
+
+    def test_worker_regrades_against_current_answer_key(self):
+        self._submit([{'question_id': self.question_ids[0], 'selected_option': 'B'}])
+        question = Question.objects.get(id=self.question_ids[0])
+        question.correct_option = 'B'
+        question.save()
+
+        call_command('grade_sessions', stdout=StringIO())
+        self.assertTrue(answered_responses(self.test_session)[0].is_correct)
+
+    def test_failed_job_is_retried_then_marked_failed(self):
+        self._submit([])
+        out = StringIO()
+        with mock.patch('questionBank.grading.grade_test_session', side_effect=RuntimeError("boom")):
+            call_command('grade_sessions', '--max-attempts', '2', stdout=out)
+
+        self.assertIn("Graded 0 sessions, 2 failed", out.getvalue())
+        job = GradingJob.objects.get(test_session=self.test_session)
+        self.assertEqual((job.status, job.attempts, job.last_error), (GradingJob.FAILED, 2, "boom"))
+
+class AnswerSheetTests(BaseTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='sheetuser@mail.com', password='password123')
+        cls.subjects = create_exam_fixture(cls.user, questions_per_worksheet=3)
+
+    def setUp(self):
+        cache.clear()
+        self.start_session()
+
+    def test_one_sheet_per_subject(self):
+        sheets = AnswerSheet.objects.filter(test_session=self.test_session).order_by('id')
+        self.assertEqual([sheet.subject_id for sheet in sheets], [subject.id for subject in self.subjects])
+        self.assertEqual(
+            [question_id for sheet in sheets for question_id in sheet.question_id_list], self.question_ids
+        )
+
+    def test_answers_are_packed_into_the_sheet(self):
+        self.client.post(reverse('submit-test-session'), {'test_session_id': self.test_session.id, 'responses': [
+            {'question_id': self.question_ids[0], 'selected_option': 'A'},
+            {'question_id': self.question_ids[2], 'selected_option': 'C'},
+        ]}, format='json')
+
+        sheet = AnswerSheet.objects.get(test_session=self.test_session, subject=self.subjects[0])
+        self.assertEqual(sheet.selected_options, "A-C")
+        self.assertEqual(sheet.correct_bits, 0b001)
+        self.assertEqual((sheet.answered_count, sheet.correct_count), (2, 1))
+
+    def test_results_read_from_sheets(self):
+        self.client.post(reverse('submit-test-session'), {'test_session_id': self.test_session.id, 'responses': [
+            {'question_id': self.question_ids[0], 'selected_option': 'B'},
+        ]}, format='json')
+        call_command('grade_sessions', stdout=StringIO())
+
+        response = self.client.get(reverse('view-test-session-results', kwargs={'session_id': self.test_session.id}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        failed = response.json()['failed_questions_by_subject']['English']
+        self.assertEqual(len(failed), 1)
+        self.assertEqual(failed[0]['user_response'], {'selected_option': 'B'})
+
+        result = Result.objects.get(test_session=self.test_session, subject=self.subjects[0])
+        self.assertEqual(
+            [(response.question_id, response.selected_option) for response in result.get_failed_questions()],
+            [(self.question_ids[0], 'B'), (self.question_ids[1], ''), (self.question_ids[2], '')]
+        )
+
+
+class QuestionTimingTests(BaseTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='timinguser@mail.com', password='password123')
+        cls.subjects = create_exam_fixture(cls.user, questions_per_worksheet=10)
+
+    def setUp(self):
+        cache.clear()
+        self.start_session()
+
+    def test_timings_give_per_subject_speed(self):
+        english_ids = self.question_ids[:10]
+        responses = [
+            {'question_id': question_id, 'selected_option': 'A', 'elapsed_ms': (position + 1) * 1000}
+            for position, question_id in enumerate(english_ids)
+        ]
+        # Math is answered without timings
+        responses += [{'question_id': question_id, 'selected_option': 'A'} for question_id in self.question_ids[10:20]]
+        self.client.post(
+            reverse('submit-test-session'), {'test_session_id': self.test_session.id, 'responses': responses}, format='json'
+        )
+        call_command('grade_sessions', stdout=StringIO())
+
+        english = Result.objects.get(test_session=self.test_session, subject=self.subjects[0])
+        self.assertAlmostEqual(english.speed, 5.5)
+        self.assertAlmostEqual(english.median_time, 5.5)
+        self.assertAlmostEqual(english.p90_time, 9.1)
+        math = Result.objects.get(test_session=self.test_session, subject=self.subjects[1])
+        self.assertIsNone(math.median_time)
+
+    def test_autosaved_timings_are_kept(self):
+        url = reverse('test-session-answers', kwargs={'session_id': self.test_session.id})
+        self.client.patch(url, {'answers': [
+            {'question_id': self.question_ids[0], 'selected_option': 'B', 'elapsed_ms': 4000},
+        ]}, format='json')
+        self.client.patch(url, {'answers': [{'question_id': self.question_ids[1], 'selected_option': 'A'}]}, format='json')
+
+        sheet = AnswerSheet.objects.get(test_session=self.test_session, subject=self.subjects[0])
+        self.assertEqual(list(sheet.elapsed_ms_array[:3]), [4000, 0, 0])
+        self.assertEqual(sheet.timing_stats(), (4.0, 4.0, 4.0))
+
+class SingleFlightSubmitTests(BaseTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='singleflightuser@mail.com', password='password123')
+        cls.subjects = create_exam_fixture(cls.user, questions_per_worksheet=2)
+
+    def setUp(self):
+        cache.clear()
+        self.start_session()
+        self.url = reverse('submit-test-session')
+
+    def test_duplicate_submit_returns_first_outcome(self):
+        first = self.client.post(self.url, {'test_session_id': self.test_session.id, 'responses': [
+            {'question_id': self.question_ids[0], 'selected_option': 'A'},
+        ]}, format='json')
+        # SAVEPOINT, session SELECT FOR UPDATE, job SELECT, RELEASE
+        with self.assertNumQueries(4):
+            second = self.client.post(self.url, {'test_session_id': self.test_session.id, 'responses': [
+                {'question_id': self.question_ids[1], 'selected_option': 'A'},
+            ]}, format='json')
+
+        self.assertEqual(second.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(second.data['grading_job_id'], first.data['grading_job_id'])
+        self.assertEqual(GradingJob.objects.filter(test_session=self.test_session).count(), 1)
+        self.assertEqual([response.question_id for response in answered_responses(self.test_session)], [self.question_ids[0]])
+
+    def test_completion_is_claimed_once(self):
+        stale = TestSession.objects.get(id=self.test_session.id)
+        self.assertTrue(SubmitTestSessionView()._claim_completion(self.test_session))
+        self.assertFalse(SubmitTestSessionView()._claim_completion(stale))
+
+    def test_completed_session_without_job_is_rejected(self):
+        TestSession.objects.filter(id=self.test_session.id).update(completed=True)
+        response = self.client.post(self.url, {'test_session_id': self.test_session.id, 'responses': []}, format='json')
+        self.assertEqual(response.data['error']['code'], "INVALID_TEST_SESSION")
+
+
+class BatchScoringTests(BaseTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='batchscoreuser@mail.com', password='password123')
+        cls.subjects = create_exam_fixture(cls.user, questions_per_worksheet=4)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(user=self.user)
+
+    def _submitted_session(self, correct_count):
+        self.start_session()
+        responses = [
+            {'question_id': question_id, 'selected_option': 'A' if position % 4 < correct_count else 'B'}
+            for position, question_id in enumerate(self.question_ids)
+        ]
+        self.client.post(reverse('submit-test-session'), {
+            'test_session_id': self.test_session.id, 'responses': responses
+        }, format='json')
+        return self.test_session
+
+    def test_batch_is_scored_with_fixed_statement_count(self):
+        test_sessions = [self._submitted_session(correct_count) for correct_count in (1, 2, 3)]
+        # sheets, replaced Results SELECT, Result INSERT, session scores UPDATE,
+        # performance subjects INSERT and SELECT, performance records INSERT,
+        # score histograms INSERT, SELECT FOR UPDATE and UPDATE, the same three for leaderboards,
+        # failed questions for the results documents, results documents upsert;
+        # the answer keys come from the cache the sessions were started with
+        with self.assertNumQueries(15):
+            results = grade_test_sessions(test_sessions)
+
+        self.assertEqual(len(results), 12)
+        scores = dict(TestSession.objects.filter(id__in=[s.id for s in test_sessions]).values_list('id', 'score'))
+        self.assertEqual([scores[test_session.id] for test_session in test_sessions], [100, 200, 300])
+        self.assertEqual(
+            set(Result.objects.filter(test_session=test_sessions[1]).values_list('score', flat=True)), {50.0}
+        )
+
+    def test_worker_grades_claimed_jobs_as_one_batch(self):
+        for correct_count in (1, 4):
+            self._submitted_session(correct_count)
+
+        out = StringIO()
+        call_command('grade_sessions', stdout=out)
+        self.assertIn("Graded 2 sessions, 0 failed", out.getvalue())
+        self.assertEqual(sorted(TestSession.objects.filter(user=self.user).values_list('score', flat=True)), [100, 400])
+
+class MessagePackNegotiationTests(BaseTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='msgpackuser@mail.com', password='password123')
+        cls.subjects = create_exam_fixture(cls.user, questions_per_worksheet=3)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(user=self.user)
+
+    def _post(self, url, data):
+        return self.client.post(
+            url, msgpack.packb(data), content_type='application/msgpack', HTTP_ACCEPT='application/msgpack'
+        )
+
+    def test_start_and_submit_in_msgpack(self):
+        response = self._post(reverse('start-test-session'), {'subjects': [subject.name for subject in self.subjects]})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        started = msgpack.unpackb(response.content)
+        question_ids = started['assigned_question_ids']
+        self.assertEqual(len(started['subjects']), 4)
+
+        response = self._post(reverse('submit-test-session'), {
+            'test_session_id': started['test_session_id'],
+            'responses': [[question_ids[0], 'A', 1500], [question_ids[1], 'B'], ['junk']],
+        })
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(msgpack.unpackb(response.content)['grading_status'], GradingJob.PENDING)
+
+        sheet = AnswerSheet.objects.get(test_session_id=started['test_session_id'], subject=self.subjects[0])
+        self.assertEqual(sheet.selected_options, "AB-")
+        self.assertEqual(list(sheet.elapsed_ms_array), [1500, 0, 0])
+
+    def test_json_stays_the_default(self):
+        response = self.client.post(
+            reverse('start-test-session'), {'subjects': [subject.name for subject in self.subjects]}, format='json'
+        )
+        self.assertEqual(response['Content-Type'], 'application/json')
+
+    def test_malformed_msgpack_is_rejected(self):
+        response = self.client.post(reverse('submit-test-session'), b'\xc1', content_type='application/msgpack')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+class ExamBundleTests(BaseTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='bundleuser@mail.com', password='password123')
+        cls.other_user = User.objects.create_user(email='otherbundleuser@mail.com', password='password123')
+        cls.subjects = create_exam_fixture(cls.user, questions_per_worksheet=3)
+
+    def setUp(self):
+        cache.clear()
+        self.start_session()
+        self.upload_url = reverse('test-session-bundle-upload')
+
+    def _download(self):
+        return self.client.get(reverse('test-session-bundle', kwargs={'session_id': self.test_session.id}))
+
+    def test_bundle_round_trip(self):
+        bundle = self._download()
+        self.assertEqual(bundle.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [question['id'] for subject in bundle.data['subjects'] for question in subject['questions']], self.question_ids
+        )
+
+        responses = [[question_id, 'A', 2000] for question_id in self.question_ids]
+        response = self.client.post(
+            self.upload_url, {'bundle_token': bundle.data['bundle_token'], 'responses': responses}, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(sum(response.is_correct for response in answered_responses(self.test_session)), 12)
+        self.test_session.refresh_from_db()
+        self.assertTrue(self.test_session.completed)
+
+    def test_tampered_or_foreign_bundle_is_rejected(self):
+        token = self._download().data['bundle_token']
+        response = self.client.post(self.upload_url, {'bundle_token': token + 'x', 'responses': []}, format='json')
+        self.assertEqual(response.data['error']['code'], "INVALID_BUNDLE")
+
+        self.client.force_authenticate(user=self.other_user)
+        response = self.client.post(self.upload_url, {'bundle_token': token, 'responses': []}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_expired_bundle_is_rejected(self):
+        token = self._download().data['bundle_token']
+        with override_settings(EXAM_BUNDLE_MAX_AGE=-1):
+            response = self.client.post(self.upload_url, {'bundle_token': token, 'responses': []}, format='json')
+        self.assertEqual(response.data['error']['code'], "BUNDLE_EXPIRED")
+        self.test_session.refresh_from_db()
+        self.assertFalse(self.test_session.completed)
+
+    def test_completed_session_has_no_bundle(self):
+        TestSession.objects.filter(id=self.test_session.id).update(completed=True)
+        self.assertEqual(self._download().status_code, status.HTTP_400_BAD_REQUEST)
+
+class ResultsViewQueryTests(BaseTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='resultsqueryuser@mail.com', password='password123')
+        cls.subjects = create_exam_fixture(cls.user, questions_per_worksheet=40)
+
+    def setUp(self):
+        cache.clear()
+        self.start_session()
+        responses = [
+            {'question_id': question_id, 'selected_option': 'B' if position % 4 == 0 else 'A'}
+            for position, question_id in enumerate(self.question_ids)
+        ]
+        self.client.post(reverse('submit-test-session'), {
+            'test_session_id': self.test_session.id, 'responses': responses
+        }, format='json')
+
+    def test_failed_questions_use_fixed_query_count(self):
+        url = reverse('view-test-session-results', kwargs={'session_id': self.test_session.id})
+        # session, answer sheets, results, failed questions joined to their subject, pending job check,
+        # plus the stored-document lookup that misses first
+        with self.assertNumQueries(6):
+            response = self.client.get(url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(ResultDocument.objects.filter(test_session=self.test_session).exists())
+        failed = response.json()['failed_questions_by_subject']
+        self.assertEqual(sorted(failed), sorted(subject.name for subject in self.subjects))
+        self.assertEqual([len(entries) for entries in failed.values()], [10, 10, 10, 10])
+        self.assertEqual(failed['Math'][0]['user_response'], {'selected_option': 'B'})
+        self.assertEqual(failed['Math'][0]['correct_option'], 'A')
+
+    def test_graded_session_serves_stored_document(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('grade_sessions', stdout=StringIO())
+        stored = ResultDocument.objects.get(test_session=self.test_session)
+        self.assertEqual(
+            [entry['score'] for entry in stored.document['results']], [75.0, 75.0, 75.0, 75.0]
+        )
+
+        url = reverse('view-test-session-results', kwargs={'session_id': self.test_session.id})
+        # Cached when grading committed: no queries at all
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['score'], 300)
+        self.assertEqual(len(response.json()['failed_questions_by_subject']['Math']), 10)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.content, b'')
+
+    def test_stored_document_is_cached_on_first_view(self):
+        call_command('grade_sessions', stdout=StringIO())
+        url = reverse('view-test-session-results', kwargs={'session_id': self.test_session.id})
+
+        # the stored document, then the score histograms its percentiles are ranked against
+        with self.assertNumQueries(2):
+            first = self.client.get(url)
+        with self.assertNumQueries(0):
+            second = self.client.get(url)
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(first['ETag'], second['ETag'])
+
+    def test_other_users_cannot_read_the_document(self):
+        call_command('grade_sessions', stdout=StringIO())
+        other_user = User.objects.create_user(email='resultsqueryother@mail.com', password='password123')
+        self.client.force_authenticate(user=other_user)
+
+        response = self.client.get(reverse('view-test-session-results', kwargs={'session_id': self.test_session.id}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class TestSessionHistoryTests(BaseTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='historyuser@mail.com', password='password123')
+        cls.subjects = create_exam_fixture(cls.user, questions_per_worksheet=2)
+        worksheet = Worksheet.objects.filter(subject=cls.subjects[1]).first()
+        cls.sessions = [TestSession.objects.create(user=cls.user, completed=True, score=index) for index in range(25)]
+        Result.objects.bulk_create([
+            Result(user=cls.user, subject=cls.subjects[1], worksheet=worksheet, test_session=test_session, score=50, speed=12)
+            for test_session in cls.sessions
+        ])
+        TestSession.objects.create(user=cls.user, completed=False)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(user=self.user)
+
+    def test_pages_walk_every_completed_session_newest_first(self):
+        url = reverse('test-session-history')
+        seen = []
+        response = self.client.get(url, {'page_size': 10})
+        while True:
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            seen.extend(session['id'] for session in response.data['sessions'])
+            if response.data['next_cursor'] is None:
+                break
+            response = self.client.get(url, {'page_size': 10, 'cursor': response.data['next_cursor']})
+
+        self.assertEqual(seen, [test_session.id for test_session in reversed(self.sessions)])
+
+    def test_page_carries_subject_scores_in_fixed_queries(self):
+        url = reverse('test-session-history')
+        first = self.client.get(url, {'page_size': 5})
+        # sessions page, Result rows of the page
+        with self.assertNumQueries(2):
+            response = self.client.get(url, {'page_size': 5, 'cursor': first.data['next_cursor']})
+
+        entry = response.data['sessions'][0]
+        self.assertEqual(entry['id'], self.sessions[19].id)
+        self.assertEqual(entry['results'], [{'subject': 'Math', 'score': 50.0, 'speed': 12.0}])
+
+    def test_invalid_cursor_and_page_size_are_rejected(self):
+        url = reverse('test-session-history')
+        response = self.client.get(url, {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['error']['code'], 'INVALID_CURSOR')
+
+        response = self.client.get(url, {'page_size': 1000})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['error']['code'], 'INVALID_PAGE')
+
+
+class ScoreHistogramTests(BaseTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='histogramuser@mail.com', password='password123')
+        cls.subjects = create_exam_fixture(cls.user, questions_per_worksheet=4)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(user=self.user)
+
+    def _graded_session(self, correct_count):
+        self.start_session()
+        self.client.post(reverse('submit-test-session'), {
+            'test_session_id': self.test_session.id,
+            'responses': [
+                {'question_id': question_id, 'selected_option': 'A' if position % 4 < correct_count else 'B'}
+                for position, question_id in enumerate(self.question_ids)
+            ],
+        }, format='json')
+        grade_test_sessions([self.test_session])
+        return self.test_session
+
+    def _math_counts(self):
+        histogram = ScoreHistogram.objects.get(subject=self.subjects[1], period=ScoreHistogram.ALL_TIME)
+        return {bucket: int(count) for bucket, count in enumerate(histogram.counts_array) if count}
+
+    def test_grading_counts_scores_and_ranks_them(self):
+        for correct_count in (1, 2, 3):
+            test_session = self._graded_session(correct_count)
+
+        self.assertEqual(self._math_counts(), {25: 1, 50: 1, 75: 1})
+        monthly = ScoreHistogram.objects.exclude(period=ScoreHistogram.ALL_TIME).get(subject=self.subjects[1])
+        self.assertEqual(monthly.counts, ScoreHistogram.objects.get(subject=self.subjects[1], period='all').counts)
+
+        stored = ResultDocument.objects.get(test_session=test_session)
+        self.assertNotIn('percentile', stored.document['results'][0])
+        response = self.client.get(reverse('view-test-session-results', kwargs={'session_id': test_session.id}))
+        self.assertEqual(
+            {(ranks['percentile'], ranks['monthly_percentile']) for ranks in response.json()['percentiles'].values()},
+            {(67, 67)}
+        )
+
+    def test_percentiles_follow_later_gradings(self):
+        test_session = self._graded_session(3)
+        url = reverse('view-test-session-results', kwargs={'session_id': test_session.id})
+        first = self.client.get(url)
+        self.assertEqual(first.json()['percentiles']['Math']['percentile'], 0)
+
+        # The histograms are cached again once the grading transaction commits
+        with self.captureOnCommitCallbacks(execute=True):
+            self._graded_session(1)
+        second = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(second['ETag'], first['ETag'])
+        self.assertEqual(second.json()['percentiles']['Math']['percentile'], 50)
+
+        third = self.client.get(url, HTTP_IF_NONE_MATCH=second['ETag'])
+        self.assertEqual(third.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_regrade_replaces_the_earlier_score(self):
+        test_session = self._graded_session(1)
+        AnswerSheet.objects.filter(test_session=test_session).update(selected_options='AAAA')
+        grade_test_sessions([test_session])
+
+        self.assertEqual(self._math_counts(), {100: 1})
+
+    def test_rebuild_matches_incremental_counts(self):
+        for correct_count in (0, 4):
+            self._graded_session(correct_count)
+        incremental = {
+            (histogram.subject_id, histogram.period): bytes(histogram.counts) for histogram in ScoreHistogram.objects.all()
+        }
+        ScoreHistogram.objects.all().delete()
+
+        out = StringIO()
+        call_command('rebuild_score_histograms', stdout=out)
+
+        self.assertIn("Rebuilt 8 score histograms", out.getvalue())
+        self.assertEqual({
+            (histogram.subject_id, histogram.period): bytes(histogram.counts) for histogram in ScoreHistogram.objects.all()
+        }, incremental)
+
+
+class LeaderboardTests(BaseTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='leaderuser@mail.com', password='password123', full_name='Ada')
+        cls.subjects = create_exam_fixture(cls.user, questions_per_worksheet=4)
+        cls.math = cls.subjects[1]
+        cls.worksheet = Worksheet.objects.get(subject=cls.math)
+        cls.others = [
+            User.objects.create_user(email=f'leader{index}@mail.com', password='password123', full_name=f'Rival {index}')
+            for index in range(3)
+        ]
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse('subject-leaderboard', kwargs={'subject_id': self.math.id})
+
+    def _grade(self, entries):
+        results = Result.objects.bulk_create([
+            Result(
+                user=user, subject=self.math, worksheet=self.worksheet, score=score, speed=speed,
+                test_session=TestSession.objects.create(user=user, completed=True),
+            )
+            for user, score, speed in entries
+        ])
+        record_leaderboard_results(results)
+
+    def test_keeps_each_users_best_ranked_by_score_then_speed(self):
+        self._grade([(self.user, 50, 20), (self.others[0], 75, 30), (self.others[1], 75, 10)])
+        self._grade([(self.user, 80, 25), (self.others[2], 25, 5)])
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [(entry['full_name'], entry['score']) for entry in response.data['entries']],
+            [('Ada', 80.0), ('Rival 1', 75.0), ('Rival 0', 75.0), ('Rival 2', 25.0)]
+        )
+        self.assertEqual(response.data['your_rank'], 1)
+        self.assertEqual(response.data['week'], leaderboard_week(timezone.now()))
+
+    @override_settings(LEADERBOARD_SIZE=2)
+    def test_leaderboard_is_bounded(self):
+        self._grade([(self.user, 10, 20), (self.others[0], 90, 30), (self.others[1], 60, 10)])
+
+        leaderboard = Leaderboard.objects.get(subject=self.math)
+        self.assertEqual([user_id for _, _, user_id in leaderboard.entry_list], [self.others[0].id, self.others[1].id])
+        self.assertIsNone(self.client.get(self.url).data['your_rank'])
+
+    def test_warm_view_costs_no_queries(self):
+        self._grade([(self.user, 50, 20), (self.others[0], 75, 30)])
+        self.client.get(self.url)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertEqual(len(response.data['entries']), 2)
+
+    def test_rebuild_matches_incremental_leaderboard(self):
+        self._grade([(self.user, 50, 20), (self.others[0], 75, 30), (self.user, 60, 40)])
+        incremental = Leaderboard.objects.get(subject=self.math).entries
+        Leaderboard.objects.all().delete()
+
+        out = StringIO()
+        call_command('rebuild_leaderboards', stdout=out)
+
+        self.assertIn("Rebuilt 1 leaderboards", out.getvalue())
+        self.assertEqual(bytes(Leaderboard.objects.get(subject=self.math).entries), bytes(incremental))
+
+    def test_invalid_week_is_rejected(self):
+        response = self.client.get(self.url, {'week': '2026-W99'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['error']['code'], 'INVALID_WEEK')
@@ -1,4 +1,5 @@
 import logging
+from django.urls import reverse
 from rest_framework.test import APITestCase
 
 # Set up logging
@@ -23,3 +24,37 @@ class BaseTestCase(APITestCase):
     def assert_failed(self, test_name, error):
         logger.error(f"{test_name} FAILED: {error} \n ")
         raise error
+
+    def start_session(self, delivery=None):
+        """
+        Authenticate as self.user and start a test session over self.subjects.
+        Sets self.test_session and self.question_ids, and returns the start response.
+        """
+        from ..models import TestSession
+
+        self.client.force_authenticate(user=self.user)
+        url = reverse('start-test-session') + (f'?delivery={delivery}' if delivery else '')
+        response = self.client.post(url, {'subjects': [subject.name for subject in self.subjects]}, format='json')
+        self.test_session = TestSession.objects.get(id=response.data['test_session_id'])
+        self.question_ids = response.data['assigned_question_ids']
+        return response
+
+
+def create_exam_fixture(user, subject_names=("English", "Math", "Science", "History"), questions_per_worksheet=1):
+    """
+    Create subjects with one worksheet each, and select them all as the user's preference.
+    Returns the subjects in creation order.
+    """
+    from ..models import Subject, Worksheet, Question, UserSubjectPreference
+
+    subjects = [Subject.objects.create(name=name) for name in subject_names]
+    for subject in subjects:
+        worksheet = Worksheet.objects.create(subject=subject, name=f"{subject.name} Worksheet")
+        Question.objects.bulk_create([
+            Question(worksheet=worksheet, text=f"Question {order}", correct_option='A', order=order)
+            for order in range(questions_per_worksheet)
+        ])
+
+    preference = UserSubjectPreference.objects.create(user=user)
+    preference.selected_subjects.set(subjects)
+    return subjects
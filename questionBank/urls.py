@@ -4,6 +4,12 @@ from questionBank.views.userSubjectPrefer_view import UserSubjectPreferenceView
 from questionBank.views.startTestSession_view import StartTestSessionView
 from questionBank.views.submitTestSession_view import SubmitTestSessionView
 from questionBank.views.viewTestResult_view import ViewTestSessionResultsView
+from questionBank.views.testSessionQuestions_view import TestSessionQuestionsView
+from questionBank.views.testSessionState_view import TestSessionStateView
+from questionBank.views.testSessionAnswers_view import TestSessionAnswersView
+from questionBank.views.examBundle_view import ExamBundleView, ExamBundleUploadView
+from questionBank.views.testSessionHistory_view import TestSessionHistoryView
+from questionBank.views.leaderboard_view import LeaderboardView
 
 
 urlpatterns = [
@@ -15,9 +21,28 @@ urlpatterns = [
     # URL for starting a new test session
     path('test-session/start/', StartTestSessionView.as_view(), name='start-test-session'),
 
+    # URL for fetching a test session's questions per subject or page (manifest delivery)
+    path('test-session/<int:session_id>/questions/', TestSessionQuestionsView.as_view(), name='test-session-questions'),
+
+    # URL for saving and resuming in-progress answers of a test session
+    path('test-session/<int:session_id>/state/', TestSessionStateView.as_view(), name='test-session-state'),
+
+    # URL for autosaving batches of answers while a test session is running
+    path('test-session/<int:session_id>/answers/', TestSessionAnswersView.as_view(), name='test-session-answers'),
+
+    # URLs for taking a test session offline: download a signed bundle, then upload the answers
+    path('test-session/<int:session_id>/bundle/', ExamBundleView.as_view(), name='test-session-bundle'),
+    path('test-session/bundle/upload/', ExamBundleUploadView.as_view(), name='test-session-bundle-upload'),
+
     # URL for submitting the test session
     path('test-session/submit/', SubmitTestSessionView.as_view(), name='submit-test-session'),
 
     # URL for viewing the results of a test session
     path('test-session/<int:session_id>/results/', ViewTestSessionResultsView.as_view(), name='view-test-session-results'),
+
+    # URL for listing the user's completed test sessions, newest first
+    path('test-session/history/', TestSessionHistoryView.as_view(), name='test-session-history'),
+
+    # URL for viewing a subject's weekly leaderboard
+    path('subjects/<int:subject_id>/leaderboard/', LeaderboardView.as_view(), name='subject-leaderboard'),
 ]
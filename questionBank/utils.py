@@ -32,3 +32,28 @@ def handle_invalid_selection(selected, required_length=4, compulsory_subject="En
         logger.warning(f"Invalid subject selection: {compulsory_subject} must be included and {required_length} subjects must be selected.")
         return False
     return True
+
+def update_subject_rows(model, key_field, changes, apply, update_fields):
+    """
+    Apply per-subject changes to rows keyed by (subject_id, `key_field`). Missing rows are
+    created, all of them are locked and `apply(row, change)` updates each in memory before
+    they are written back: three statements however many rows change. Call it in a
+    transaction. Returns the updated rows by key.
+    """
+    model.objects.bulk_create(
+        [model(subject_id=subject_id, **{key_field: key}) for subject_id, key in changes],
+        ignore_conflicts=True,
+    )
+    # Locking in a fixed order keeps concurrent grading workers from deadlocking
+    rows = {
+        (row.subject_id, getattr(row, key_field)): row
+        for row in model.objects.select_for_update().filter(
+            subject_id__in={subject_id for subject_id, _ in changes},
+            **{f'{key_field}__in': {key for _, key in changes}},
+        ).order_by('subject_id', key_field)
+        if (row.subject_id, getattr(row, key_field)) in changes
+    }
+    for key, row in rows.items():
+        apply(row, changes[key])
+    model.objects.bulk_update(rows.values(), update_fields)
+    return rows
@@ -0,0 +1,106 @@
+from datetime import timedelta
+from django.conf import settings
+from django.utils import timezone
+from itsdangerous import BadSignature, SignatureExpired
+from rest_framework import status
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.views import APIView
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from user_auth.utils import generate_token, verify_token
+from ..models import TestSession
+from ..cache_utils import get_session_manifest, get_worksheet_payloads
+from ..idempotency import idempotent
+from ..renderers import MessagePackRenderer
+from ..utils import format_error_response
+from .submitTestSession_view import SubmitTestSessionView
+
+BUNDLE_SALT = 'exam-bundle'
+
+class ExamBundleView(APIView):
+    """
+    API endpoint to download a whole test session for offline use: every question of
+    the session grouped by subject, with a signed token that the upload endpoint checks.
+    The token expires after EXAM_BUNDLE_MAX_AGE seconds.
+    """
+    permission_classes = [IsAuthenticated]
+    renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES + [MessagePackRenderer]
+
+    def get(self, request, session_id):
+        manifest = get_session_manifest(session_id, request.user.id)
+        if manifest is None:
+            return Response(format_error_response(
+                status.HTTP_404_NOT_FOUND,
+                "TEST_SESSION_NOT_FOUND",
+                "No test session matches the given query."
+            ), status=status.HTTP_404_NOT_FOUND)
+
+        if not TestSession.objects.filter(id=session_id, completed=False).exists():
+            return Response(format_error_response(
+                status.HTTP_400_BAD_REQUEST,
+                "INVALID_TEST_SESSION",
+                "This test session is already completed."
+            ), status=status.HTTP_400_BAD_REQUEST)
+
+        token = generate_token({"test_session_id": session_id, "user_id": request.user.id}, settings.SECRET_KEY, BUNDLE_SALT)
+        return Response({
+            "test_session_id": session_id,
+            "expires_at": timezone.now() + timedelta(seconds=settings.EXAM_BUNDLE_MAX_AGE),
+            "subjects": self._build_subjects(manifest),
+            "bundle_token": token,
+        }, status=status.HTTP_200_OK)
+
+    def _build_subjects(self, manifest):
+        """
+        Take each subject's questions from the cached worksheet payloads, keeping only
+        the questions assigned to the session.
+        """
+        payloads = get_worksheet_payloads([entry['worksheet_id'] for entry in manifest if entry['worksheet_id'] is not None])
+        subjects = []
+        for entry in manifest:
+            payload = payloads.get(entry['worksheet_id'])
+            if payload is None:
+                continue
+            question_ids = set(entry['question_ids'])
+            subjects.append({
+                "subject": payload['subject'],
+                "worksheet_id": entry['worksheet_id'],
+                "content_hash": payload['content_hash'],
+                "questions": [question for question in payload['worksheet']['questions'] if question['id'] in question_ids],
+            })
+        return subjects
+
+class ExamBundleUploadView(SubmitTestSessionView):
+    """
+    API endpoint to hand in a test session taken offline from a bundle:
+    {"bundle_token": "...", "responses": [...]}. The token is verified and the answers
+    are graded into the session's answer sheets in one bulk update, as a submit would.
+    """
+
+    @idempotent('upload-exam-bundle')
+    def post(self, request):
+        try:
+            bundle = verify_token(
+                str(request.data.get('bundle_token', '')), settings.SECRET_KEY, BUNDLE_SALT, max_age=settings.EXAM_BUNDLE_MAX_AGE
+            )
+        except SignatureExpired:
+            return Response(format_error_response(
+                status.HTTP_400_BAD_REQUEST,
+                "BUNDLE_EXPIRED",
+                "This exam bundle has expired."
+            ), status=status.HTTP_400_BAD_REQUEST)
+        except BadSignature:
+            return Response(format_error_response(
+                status.HTTP_400_BAD_REQUEST,
+                "INVALID_BUNDLE",
+                "The exam bundle token is not valid."
+            ), status=status.HTTP_400_BAD_REQUEST)
+
+        if bundle.get('user_id') != request.user.id:
+            return Response(format_error_response(
+                status.HTTP_403_FORBIDDEN,
+                "BUNDLE_NOT_OWNED",
+                "This exam bundle was issued to another user."
+            ), status=status.HTTP_403_FORBIDDEN)
+
+        return self._submit(request.user, bundle['test_session_id'], request.data.get('responses', []))
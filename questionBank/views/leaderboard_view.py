@@ -0,0 +1,49 @@
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.views import APIView
+from rest_framework.response import Response
+from ..leaderboards import get_leaderboard, leaderboard_week, week_bounds
+from ..subject_registry import get_subject_registry
+from ..utils import format_error_response
+
+class LeaderboardView(APIView):
+    """
+    API endpoint to view a subject's weekly leaderboard: the best candidates of the week,
+    one entry each, with the requesting user's own rank when they are on it.
+    Defaults to the current week; pass `week` as YYYY-Www for another.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, subject_id):
+        subject_name = get_subject_registry().get_name(subject_id)
+        if subject_name is None:
+            return Response(format_error_response(
+                status.HTTP_404_NOT_FOUND,
+                "SUBJECT_NOT_FOUND",
+                "No subject matches the given query."
+            ), status=status.HTTP_404_NOT_FOUND)
+
+        week = request.query_params.get('week') or leaderboard_week(timezone.now())
+        try:
+            week_bounds(week)
+        except ValueError:
+            return Response(format_error_response(
+                status.HTTP_400_BAD_REQUEST,
+                "INVALID_WEEK",
+                "week must be an ISO week written as YYYY-Www."
+            ), status=status.HTTP_400_BAD_REQUEST)
+
+        ranking = get_leaderboard(subject_id, week)
+        your_rank = next(
+            (rank for rank, (user_id, *_) in enumerate(ranking, start=1) if user_id == request.user.id), None
+        )
+        return Response({
+            "subject": subject_name,
+            "week": week,
+            "entries": [
+                {"rank": rank, "full_name": full_name, "score": score, "speed": speed}
+                for rank, (_, full_name, score, speed) in enumerate(ranking, start=1)
+            ],
+            "your_rank": your_rank,
+        }, status=status.HTTP_200_OK)
@@ -1,20 +1,34 @@
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.views import APIView
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 from rest_framework import status
-from ..models import TestSession, Subject, Question, Worksheet, TestSessionQuestion
-from ..serializers import SubjectSerializer, QuestionSerializer
+from ..models import Question, TestSession
+from ..admission import exam_start_admission
+from ..cache_utils import cache_session_manifest
+from ..exposure import load_exposures, record_exposures
+from ..paper_pool import build_paper, claim_paper, personalize_paper
+from ..idempotency import idempotent
+from ..parsers import MessagePackParser
+from ..renderers import MessagePackRenderer
+from ..subject_registry import get_subject_registry
 from ..utils import format_error_response, validate_subject_selection
-import random
+from ..worksheet_index import get_worksheet_index
 
 class StartTestSessionView(APIView):
     """
     API endpoint to start a new test session.
     A test session is started with English as a compulsory subject,
     and any additional 3 subjects chosen by the user from their preferences.
+    With `delivery=manifest` only the session manifest is returned and questions
+    are fetched from the session questions endpoint.
+    Requests and responses may use MessagePack (`application/msgpack`) instead of JSON.
     """
     permission_classes = [IsAuthenticated]
+    parser_classes = api_settings.DEFAULT_PARSER_CLASSES + [MessagePackParser]
+    renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES + [MessagePackRenderer]
 
+    @idempotent('start-test-session')
     def post(self, request):
         """
         Handle the creation of a test session based on selected subjects.
@@ -37,57 +51,55 @@ class StartTestSessionView(APIView):
                 "You must select exactly 4 subjects, including English."
             ))
 
-        test_session = self._create_test_session(user, selected_subject_names)
-        subjects_with_questions, assigned_question_ids = self._assign_questions_to_session(test_session)
-
-        return Response({
-            "test_session_id": test_session.id,
-            "subjects": subjects_with_questions,
-            "assigned_question_ids": assigned_question_ids
-        }, status=status.HTTP_201_CREATED)
-
-    def _create_test_session(self, user, selected_subject_names):
-        selected_subjects = Subject.objects.filter(name__in=selected_subject_names)
-        test_session = TestSession.objects.create(user=user)
-        test_session.subjects.set(selected_subjects)
-        return test_session
-
-    def _assign_questions_to_session(self, test_session):
-        subjects_with_questions = []
-        assigned_question_ids = []
+        registry = get_subject_registry()
+        subject_ids = registry.resolve(selected_subject_names)
+        if subject_ids is None or len(set(subject_ids)) != len(subject_ids):
+            return Response(format_error_response(
+                status.HTTP_400_BAD_REQUEST,
+                "INVALID_SUBJECTS",
+                "One or more invalid subjects selected."
+            ), status=status.HTTP_400_BAD_REQUEST)
 
-        for subject in test_session.subjects.all():
-            worksheet, worksheet_data = self._get_worksheet_data_for_subject(subject)
-            questions = Question.objects.filter(worksheet=worksheet).distinct()
+        admission = exam_start_admission.admit()
+        if not admission.admitted:
+            return Response(format_error_response(
+                status.HTTP_429_TOO_MANY_REQUESTS,
+                "EXAM_START_BUSY",
+                "Too many test sessions are starting right now. Please retry shortly.",
+                {"queue_position": admission.queue_position, "retry_after": admission.retry_after}
+            ), status=status.HTTP_429_TOO_MANY_REQUESTS, headers={"Retry-After": str(admission.retry_after)})
 
-            self._assign_questions_to_test_session(test_session, questions, assigned_question_ids)
-            worksheet_data['questions'] = QuestionSerializer(questions, many=True).data
-            subject_data = SubjectSerializer(subject).data
-            subject_data['worksheets'] = [worksheet_data]
-            subjects_with_questions.append(subject_data)
+        try:
+            return self._start_test_session(request, user, registry.get_subjects(subject_ids))
+        finally:
+            exam_start_admission.release()
 
-        return subjects_with_questions, assigned_question_ids
+    def _start_test_session(self, request, user, selected_subjects):
+        subject_ids = [subject.id for subject in selected_subjects]
+        exposures = load_exposures(user.id)
+        paper = claim_paper(subject_ids)
+        paper = personalize_paper(paper, exposures) if paper else build_paper(selected_subjects, exposures)
 
-    def _get_worksheet_data_for_subject(self, subject):
-        worksheets = Worksheet.objects.filter(subject=subject)
-        if worksheets.exists():
-            worksheet = random.choice(worksheets)
-            worksheet_data = {
-                "worksheet_id": worksheet.id,
-                "worksheet_title": worksheet.name,
-                "questions": []
-            }
-        else:
-            worksheet_data = {
-                "worksheet_id": None,
-                "worksheet_title": "No worksheets available",
-                "questions": []
-            }
-            worksheet = None
+        try:
+            test_session = TestSession.create_with_questions(user, paper['subject_ids'], paper['question_ids'])
+        except Question.DoesNotExist:
+            # The paper came from a stale worksheet index; build one from the reloaded index
+            paper = build_paper(selected_subjects, exposures)
+            test_session = TestSession.create_with_questions(user, paper['subject_ids'], paper['question_ids'])
+        record_exposures(user.id, get_worksheet_index(), paper['worksheet_ids'], exposures)
+        cache_session_manifest(test_session.id, user.id, paper['manifest'])
 
-        return worksheet, worksheet_data
+        if request.query_params.get('delivery', request.data.get('delivery')) == 'manifest':
+            # Questions are fetched separately from TestSessionQuestionsView
+            return Response({
+                "test_session_id": test_session.id,
+                "delivery": "manifest",
+                "subjects": paper['manifest'],
+                "assigned_question_ids": paper['question_ids']
+            }, status=status.HTTP_201_CREATED)
 
-    def _assign_questions_to_test_session(self, test_session, questions, assigned_question_ids):
-        for question in questions:
-            TestSessionQuestion.objects.create(test_session=test_session, question=question)
-            assigned_question_ids.append(question.id)
+        return Response({
+            "test_session_id": test_session.id,
+            "subjects": paper['subjects'],
+            "assigned_question_ids": paper['question_ids']
+        }, status=status.HTTP_201_CREATED)
@@ -1,19 +1,36 @@
+from django.db import transaction
 from django.utils import timezone
 from django.shortcuts import get_object_or_404
 from rest_framework import status
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from ..models import TestSession, TestSessionQuestion, Question, UserResponse
-from ..serializers import UserResponseSerializer
+from rest_framework.settings import api_settings
+from ..models import GradingJob, TestSession
+from ..grading import VALID_OPTIONS, enqueue_grading, load_answer_key, save_responses
+from ..idempotency import idempotent
+from ..parsers import MessagePackParser
+from ..renderers import MessagePackRenderer
+from ..session_state import clear_session_state, get_pending_answers, get_session_state
 from ..utils import format_error_response, logger
 
 class SubmitTestSessionView(APIView):
     """
     API endpoint to submit responses for a test session.
+    Responses are checked against the session's answer key and written together with
+    any cached in-progress answers to the session's answer sheets in one bulk update.
+    Answers already autosaved through the answers endpoint are not written again.
+    Scoring is queued for the `grade_sessions` worker, so the request is answered with
+    202 Accepted. Completion is claimed under a row lock, so a duplicate submit gets the
+    first submit's outcome and changes nothing.
+    Requests and responses may use MessagePack (`application/msgpack`) instead of JSON,
+    and each response may be a compact [question_id, selected_option, elapsed_ms] list.
     """
     permission_classes = [IsAuthenticated]
+    parser_classes = api_settings.DEFAULT_PARSER_CLASSES + [MessagePackParser]
+    renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES + [MessagePackRenderer]
 
+    @idempotent('submit-test-session')
     def post(self, request):
         user = request.user
         test_session_id = request.data.get('test_session_id')
@@ -26,60 +43,96 @@ class SubmitTestSessionView(APIView):
                 "Test session ID is required."
             ))
 
-        test_session = self._get_active_test_session(test_session_id, user)
-        if not test_session:
+        return self._submit(user, test_session_id, responses)
+
+    def _submit(self, user, test_session_id, responses):
+        """
+        Save the responses, complete the session and queue its grading.
+        """
+        with transaction.atomic():
+            # Concurrent submits of the same session queue up on this row lock
+            test_session = get_object_or_404(TestSession.objects.select_for_update(), id=test_session_id, user=user)
+            if test_session.completed or not self._claim_completion(test_session):
+                return self._already_submitted(test_session)
+
+            # Answers autosaved during the exam are already in the database; only
+            # cached-but-unwritten answers and the submitted ones need writing here
+            state = get_session_state(test_session.id)
+            answers = get_pending_answers(state)
+            submitted_answers, elapsed_ms = self._collect_answers(test_session, responses)
+            answers.update(submitted_answers)
+
+            answer_key = load_answer_key(test_session)
+            submitted_question_ids = save_responses(test_session, answers, answer_key, elapsed_ms)
+            grading_job = enqueue_grading(test_session)
+        clear_session_state(test_session.id)
+
+        answered_question_ids = submitted_question_ids | (state["answers"].keys() & answer_key.keys())
+        if len(answered_question_ids) != len(answer_key):
+            missing_questions = set(answer_key) - answered_question_ids
+            logger.warning(f"Missing submitted questions for session {test_session_id}: {missing_questions}")
+
+        return self._submission_response(test_session, grading_job)
+
+    def _claim_completion(self, test_session):
+        """
+        Mark the session completed only if it still is not, so exactly one submit wins
+        even where the database cannot lock rows. Returns True for the winner.
+        """
+        test_session.end_time = timezone.now()
+        test_session.completed = True
+        return TestSession.objects.filter(id=test_session.id, completed=False).update(
+            completed=True, end_time=test_session.end_time
+        ) == 1
+
+    def _already_submitted(self, test_session):
+        """
+        Answer a repeated submit with the outcome of the first one, without writing anything.
+        """
+        grading_job = GradingJob.objects.filter(test_session_id=test_session.id).first()
+        if grading_job is None:
             return Response(format_error_response(
                 status.HTTP_400_BAD_REQUEST, 
                 "INVALID_TEST_SESSION", 
                 "This test session is already completed or does not exist."
             ))
-
-        assigned_question_ids = set(TestSessionQuestion.objects.filter(test_session=test_session).values_list('question_id', flat=True))
-        submitted_question_ids = self._process_responses(user, test_session, responses, assigned_question_ids)
-
-        if assigned_question_ids != submitted_question_ids:
-            missing_questions = assigned_question_ids - submitted_question_ids
-            logger.warning(f"Missing submitted questions for session {test_session_id}: {missing_questions}")
-
-        self._complete_test_session(test_session)
-
-        return Response({"detail": "Test session responses submitted successfully."}, status=status.HTTP_200_OK)
-
-    def _get_active_test_session(self, test_session_id, user):
-        test_session = get_object_or_404(TestSession, id=test_session_id, user=user)
-        return test_session if not test_session.completed else None
-
-    def _process_responses(self, user, test_session, responses, assigned_question_ids):
-        submitted_question_ids = set()
-
+        return self._submission_response(test_session, grading_job)
+
+    def _submission_response(self, test_session, grading_job):
+        return Response({
+            "detail": "Test session responses submitted successfully. Grading is in progress.",
+            "test_session_id": test_session.id,
+            "grading_job_id": grading_job.id,
+            "grading_status": grading_job.status,
+        }, status=status.HTTP_202_ACCEPTED)
+
+    def _collect_answers(self, test_session, responses):
+        """
+        Turn the submitted response list into {question_id: selected_option} and
+        {question_id: elapsed_ms} for the entries that report the time spent.
+        Malformed entries are logged and dropped; the answer key filters the rest.
+        """
+        answers = {}
+        elapsed_ms = {}
         for response_data in responses:
+            if isinstance(response_data, (list, tuple)):
+                # Compact form: [question_id, selected_option] or [question_id, selected_option, elapsed_ms]
+                response_data = dict(zip(('question_id', 'selected_option', 'elapsed_ms'), response_data))
+            elif not isinstance(response_data, dict):
+                response_data = {}
             question_id = response_data.get('question_id')
             selected_option = response_data.get('selected_option')
 
-            if not question_id or int(question_id) not in assigned_question_ids:
-                logger.error(f"Question ID {question_id} not found or invalid in session {test_session.id}")
+            if (
+                not str(question_id).isdigit()
+                or not isinstance(selected_option, str)
+                or selected_option not in VALID_OPTIONS
+            ):
+                logger.error(f"Invalid response {response_data} in session {test_session.id}")
                 continue
 
-            submitted_question_ids.add(int(question_id))
-            self._save_user_response(user, test_session, question_id, selected_option)
-
-        return submitted_question_ids
+            answers[int(question_id)] = selected_option
+            if str(response_data.get('elapsed_ms', '')).isdigit():
+                elapsed_ms[int(question_id)] = int(response_data['elapsed_ms'])
 
-    def _save_user_response(self, user, test_session, question_id, selected_option):
-        question = get_object_or_404(Question, id=question_id)
-        serializer = UserResponseSerializer(data={
-            'user': user.id,
-            'question': question.id,
-            'selected_option': selected_option,
-            'test_session': test_session.id
-        })
-
-        if serializer.is_valid():
-            serializer.save()
-        else:
-            logger.error(f"Validation error for question {question_id}: {serializer.errors}")
-
-    def _complete_test_session(self, test_session):
-        test_session.end_time = timezone.now()
-        test_session.completed = True
-        test_session.save()
+        return answers, elapsed_ms
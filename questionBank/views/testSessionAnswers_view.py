@@ -0,0 +1,70 @@
+from django.db import transaction
+from django.shortcuts import get_object_or_404
+from rest_framework import status
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.views import APIView
+from rest_framework.response import Response
+from ..models import TestSession
+from ..grading import VALID_OPTIONS, save_responses
+from ..session_state import record_answers
+from ..utils import format_error_response
+
+MAX_BATCH_SIZE = 200
+
+class TestSessionAnswersView(APIView):
+    """
+    API endpoint to autosave small batches of answers while a test session is running.
+    Each batch is written into the session's answer sheets in one statement, so submitting the
+    session only has to write whatever was not autosaved.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def patch(self, request, session_id):
+        """
+        Save a batch of answers: {"answers": [{"question_id": 1, "selected_option": "A", "elapsed_ms": 5200}, ...]}.
+        `elapsed_ms`, the time spent on the question so far, is optional.
+        """
+        answers = request.data.get('answers', [])
+        if not isinstance(answers, list) or len(answers) > MAX_BATCH_SIZE:
+            return Response(format_error_response(
+                status.HTTP_400_BAD_REQUEST,
+                "INVALID_ANSWERS",
+                f"answers must be a list of at most {MAX_BATCH_SIZE} question_id/selected_option pairs."
+            ), status=status.HTTP_400_BAD_REQUEST)
+
+        batch = {
+            int(answer['question_id']): answer.get('selected_option')
+            for answer in answers
+            if isinstance(answer, dict)
+            and str(answer.get('question_id', '')).isdigit()
+            and isinstance(answer.get('selected_option'), str)
+            and answer['selected_option'] in VALID_OPTIONS
+        }
+        elapsed_ms = {
+            int(answer['question_id']): int(answer['elapsed_ms'])
+            for answer in answers
+            if isinstance(answer, dict)
+            and str(answer.get('question_id', '')).isdigit()
+            and str(answer.get('elapsed_ms', '')).isdigit()
+        }
+        with transaction.atomic():
+            # Holding the row lock keeps a concurrent submit from completing the session
+            # between the check and the write, which would overwrite its submitted answers
+            test_session = get_object_or_404(
+                TestSession.objects.select_for_update().only('id', 'user_id'),
+                id=session_id, user=request.user, completed=False
+            )
+            saved_question_ids = save_responses(test_session, batch, elapsed_ms=elapsed_ms)
+        # Keep the resumable state in step, without marking these answers for another write
+        state = record_answers(
+            test_session.id,
+            {question_id: batch[question_id] for question_id in saved_question_ids},
+            persisted=True
+        )
+
+        return Response({
+            "test_session_id": test_session.id,
+            "saved_question_ids": sorted(saved_question_ids),
+            "rejected_count": len(answers) - len(saved_question_ids),
+            "revision": state["revision"],
+        }, status=status.HTTP_200_OK)
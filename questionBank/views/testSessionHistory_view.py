@@ -0,0 +1,84 @@
+import base64
+import binascii
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework import status
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.views import APIView
+from rest_framework.response import Response
+from ..models import Result, TestSession
+from ..subject_registry import get_subject_registry
+from ..utils import format_error_response
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+class TestSessionHistoryView(APIView):
+    """
+    API endpoint listing the user's completed test sessions, newest first, with the
+    per-subject scores of each. Pages are keyset-paginated: `next_cursor` marks the
+    last session returned, so a page costs the same however far back it is.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        try:
+            page_size = int(request.query_params.get('page_size', DEFAULT_PAGE_SIZE))
+        except ValueError:
+            page_size = 0
+        if not 1 <= page_size <= MAX_PAGE_SIZE:
+            return Response(format_error_response(
+                status.HTTP_400_BAD_REQUEST,
+                "INVALID_PAGE",
+                f"page_size must be an integer between 1 and {MAX_PAGE_SIZE}."
+            ), status=status.HTTP_400_BAD_REQUEST)
+
+        sessions = TestSession.objects.filter(user=request.user, completed=True)
+        cursor = request.query_params.get('cursor')
+        if cursor:
+            position = self._decode_cursor(cursor)
+            if position is None:
+                return Response(format_error_response(
+                    status.HTTP_400_BAD_REQUEST,
+                    "INVALID_CURSOR",
+                    "The cursor is not valid."
+                ), status=status.HTTP_400_BAD_REQUEST)
+            start_time, session_id = position
+            sessions = sessions.filter(Q(start_time__lt=start_time) | Q(start_time=start_time, id__lt=session_id))
+
+        # One row past the page tells whether there is a next page
+        sessions = list(
+            sessions.order_by('-start_time', '-id').values('id', 'start_time', 'end_time', 'score')[:page_size + 1]
+        )
+        has_next = len(sessions) > page_size
+        sessions = sessions[:page_size]
+
+        results = {session['id']: [] for session in sessions}
+        registry = get_subject_registry()
+        for test_session_id, subject_id, score, speed in Result.objects.filter(
+            test_session_id__in=results
+        ).order_by('id').values_list('test_session_id', 'subject_id', 'score', 'speed'):
+            results[test_session_id].append({
+                "subject": registry.get_name(subject_id),
+                "score": score,
+                "speed": speed,
+            })
+
+        return Response({
+            "sessions": [dict(session, results=results[session['id']]) for session in sessions],
+            "next_cursor": self._encode_cursor(sessions[-1]) if has_next else None,
+        }, status=status.HTTP_200_OK)
+
+    def _encode_cursor(self, session):
+        position = f"{session['start_time'].isoformat()}|{session['id']}"
+        return base64.urlsafe_b64encode(position.encode()).decode()
+
+    def _decode_cursor(self, cursor):
+        try:
+            start_time, session_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+            start_time, session_id = parse_datetime(start_time), int(session_id)
+        except (binascii.Error, UnicodeDecodeError, ValueError):
+            return None
+        if start_time is None:
+            return None
+        return start_time, session_id
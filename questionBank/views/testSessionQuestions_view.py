@@ -0,0 +1,89 @@
+from django.utils.cache import patch_cache_control
+from rest_framework import status
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.views import APIView
+from rest_framework.response import Response
+from ..cache_utils import get_session_manifest, get_worksheet_payloads
+from ..utils import format_error_response
+
+QUESTIONS_MAX_AGE = 60 * 60 * 24  # 1 day; a content hash never changes meaning
+DEFAULT_PAGE_SIZE = 20
+
+class TestSessionQuestionsView(APIView):
+    """
+    API endpoint to fetch the questions of a test session started in manifest mode,
+    one subject at a time and optionally one page at a time.
+    Responses carry a strong ETag derived from the worksheet content hash.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, session_id):
+        manifest = get_session_manifest(session_id, request.user.id)
+        if manifest is None:
+            return Response(format_error_response(
+                status.HTTP_404_NOT_FOUND,
+                "TEST_SESSION_NOT_FOUND",
+                "No test session matches the given query."
+            ), status=status.HTTP_404_NOT_FOUND)
+
+        subject_entry = self._get_subject_entry(manifest, request.query_params.get('subject'))
+        if subject_entry is None:
+            return Response(format_error_response(
+                status.HTTP_400_BAD_REQUEST,
+                "INVALID_SUBJECT",
+                "The subject is not part of this test session."
+            ), status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            page = int(request.query_params.get('page', 0))
+            page_size = int(request.query_params.get('page_size', DEFAULT_PAGE_SIZE))
+        except ValueError:
+            page, page_size = -1, 0
+        if page < 0 or page_size < 1:
+            return Response(format_error_response(
+                status.HTTP_400_BAD_REQUEST,
+                "INVALID_PAGE",
+                "page and page_size must be positive integers."
+            ), status=status.HTTP_400_BAD_REQUEST)
+
+        payload = get_worksheet_payloads([subject_entry['worksheet_id']]).get(subject_entry['worksheet_id'])
+        if payload is None:
+            return Response(format_error_response(
+                status.HTTP_404_NOT_FOUND,
+                "WORKSHEET_NOT_FOUND",
+                "The worksheet for this subject no longer exists."
+            ), status=status.HTTP_404_NOT_FOUND)
+
+        etag = f'"{payload["content_hash"]}-{page}-{page_size if page else 0}"'
+        if etag in request.headers.get('If-None-Match', ''):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            # The worksheet may have gained questions since the session started
+            assigned_ids = set(subject_entry['question_ids'])
+            questions = [question for question in payload['worksheet']['questions'] if question['id'] in assigned_ids]
+            total_questions = len(questions)
+            if page:
+                questions = questions[(page - 1) * page_size:page * page_size]
+            response = Response({
+                "test_session_id": session_id,
+                "subject": payload['subject'],
+                "worksheet_id": subject_entry['worksheet_id'],
+                "content_hash": payload['content_hash'],
+                "page": page or None,
+                "total_questions": total_questions,
+                "questions": questions,
+            }, status=status.HTTP_200_OK)
+
+        response['ETag'] = etag
+        patch_cache_control(response, private=True, max_age=QUESTIONS_MAX_AGE, immutable=True)
+        return response
+
+    def _get_subject_entry(self, manifest, subject_id):
+        try:
+            subject_id = int(subject_id)
+        except (TypeError, ValueError):
+            return None
+        for entry in manifest:
+            if entry['id'] == subject_id and entry['worksheet_id'] is not None:
+                return entry
+        return None
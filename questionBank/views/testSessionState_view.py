@@ -0,0 +1,66 @@
+from django.shortcuts import get_object_or_404
+from rest_framework import status
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.views import APIView
+from rest_framework.response import Response
+from ..models import TestSession
+from ..cache_utils import get_cached_session_manifest
+from ..session_state import get_session_state, record_answers
+from ..utils import format_error_response
+
+class TestSessionStateView(APIView):
+    """
+    API endpoint holding the answers of a test session that is still in progress.
+    Updates only touch the cache; answers reach the database when the session is
+    submitted or when the flush_session_states sweeper runs.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, session_id):
+        """
+        Return the answers recorded so far, so a client can resume after a crash.
+        """
+        self._get_allowed_question_ids(session_id, request.user)
+        return Response(self._serialize_state(session_id, get_session_state(session_id)), status=status.HTTP_200_OK)
+
+    def post(self, request, session_id):
+        """
+        Record a batch of answers: {"answers": [{"question_id": 1, "selected_option": "A"}, ...]}.
+        """
+        allowed_question_ids = self._get_allowed_question_ids(session_id, request.user)
+        answers = request.data.get('answers', [])
+        if not isinstance(answers, list):
+            return Response(format_error_response(
+                status.HTTP_400_BAD_REQUEST,
+                "INVALID_ANSWERS",
+                "answers must be a list of question_id/selected_option pairs."
+            ), status=status.HTTP_400_BAD_REQUEST)
+
+        state = record_answers(session_id, {
+            answer.get('question_id'): answer.get('selected_option')
+            for answer in answers
+            if isinstance(answer, dict) and str(answer.get('question_id', '')).isdigit()
+        }, allowed_question_ids)
+        return Response(self._serialize_state(session_id, state), status=status.HTTP_200_OK)
+
+    def _get_allowed_question_ids(self, session_id, user):
+        """
+        Check the session belongs to the user, from the cached manifest when possible.
+        Returns the session's question ids, or None when only the database was consulted.
+        """
+        manifest = get_cached_session_manifest(session_id)
+        if manifest is not None and manifest['user_id'] == user.id:
+            return {question_id for entry in manifest['subjects'] for question_id in entry['question_ids']}
+        get_object_or_404(TestSession, id=session_id, user=user, completed=False)
+        return None
+
+    def _serialize_state(self, session_id, state):
+        return {
+            "test_session_id": session_id,
+            "answers": [
+                {"question_id": question_id, "selected_option": option}
+                for question_id, option in state["answers"].items()
+            ],
+            "revision": state["revision"],
+            "updated_at": state["updated_at"],
+        }
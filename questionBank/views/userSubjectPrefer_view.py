@@ -3,8 +3,9 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from django.shortcuts import get_object_or_404
-from ..models import UserSubjectPreference, Subject
+from ..models import UserSubjectPreference
 from ..serializers import UserSubjectPreferenceSerializer
+from ..subject_registry import get_subject_registry
 from ..utils import format_error_response
 
 class UserSubjectPreferenceView(APIView):
@@ -37,8 +38,8 @@ class UserSubjectPreferenceView(APIView):
                 "You must select exactly 4 subjects, including English."
             ))
 
-        selected_subjects = Subject.objects.filter(name__in=subjects)
-        if selected_subjects.count() != 4:
+        selected_subject_ids = get_subject_registry().resolve(subjects)
+        if selected_subject_ids is None or len(set(selected_subject_ids)) != 4:
             return Response(format_error_response(
                 status.HTTP_400_BAD_REQUEST, 
                 "INVALID_SUBJECTS", 
@@ -46,7 +47,7 @@ class UserSubjectPreferenceView(APIView):
             ))
 
         preference, _ = UserSubjectPreference.objects.get_or_create(user=user)
-        preference.selected_subjects.set(selected_subjects)
+        preference.selected_subjects.set(selected_subject_ids)
         preference.save()
 
         return Response({"message": "Subjects selected successfully."}, status=status.HTTP_200_OK)
@@ -1,73 +1,52 @@
+from django.http import HttpResponse
+from django.utils.cache import patch_cache_control
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from django.shortcuts import get_object_or_404
-from ..models import TestSession, TestSessionQuestion, UserResponse, Question
-from ..serializers import QuestionSerializer, UserResponseSerializer
+from ..models import TestSession
+from ..result_documents import build_result_document, get_result_document, with_percentiles
 from ..utils import format_error_response
 
 class ViewTestSessionResultsView(APIView):
     """
-    API endpoint to view failed questions in a completed test session.
-    Shows the failed questions grouped by subject, along with user's incorrect response 
+    API endpoint to view the results of a completed test session: the per-subject scores
+    and the failed questions grouped by subject, along with user's incorrect response
     and the correct answer for each failed question.
+    The document is rendered once when the session is graded and served with a strong ETag.
+    Each subject's percentiles move as other candidates are graded, so they are looked up
+    from the score histograms on every request and folded into the ETag.
     """
     permission_classes = [IsAuthenticated]
 
     def get(self, request, session_id):
         """
-        Get the failed questions of the specified test session, grouped by subject.
+        Get the results document of the specified test session.
         """
         user = request.user
-        test_session = get_object_or_404(TestSession, id=session_id, user=user)
-
-        if not test_session.completed:
-            return Response(format_error_response(
-                status.HTTP_400_BAD_REQUEST, 
-                "INCOMPLETE_TEST_SESSION", 
-                "The test session is not yet completed."
-            ))
-
-        # Fetch session questions and user responses
-        session_questions = TestSessionQuestion.objects.filter(test_session=test_session)
-        user_responses = UserResponse.objects.filter(test_session=test_session, user=user)
-
-        failed_questions_by_subject = self._get_failed_questions_by_subject(session_questions, user_responses)
-
-        return Response({
-            "test_session_id": test_session.id,
-            "subjects": [subject.name for subject in test_session.subjects.all()],
-            "start_time": test_session.start_time,
-            "end_time": test_session.end_time,
-            "failed_questions_by_subject": failed_questions_by_subject  # Failed questions grouped by subject
-        }, status=status.HTTP_200_OK)
-
-    def _get_failed_questions_by_subject(self, session_questions, user_responses):
-        """
-        Build a dictionary of failed questions grouped by subject.
-        Each entry will contain the failed question, the user's incorrect response, 
-        and the correct option for that question.
-        """
-        question_response_map = {response.question.id: response for response in user_responses}
-        failed_questions_by_subject = {}
-
-        for session_question in session_questions:
-            question = session_question.question
-            user_response = question_response_map.get(question.id)
-            subject = question.subject.name  # Assuming Question has a 'subject' field
-
-            # Initialize the subject group if not already present
-            if subject not in failed_questions_by_subject:
-                failed_questions_by_subject[subject] = []
-
-            # If user answered the question and it was incorrect
-            if user_response and question.correct_option != user_response.selected_option:
-                failed_question = {
-                    "question": QuestionSerializer(question).data,
-                    "user_response": UserResponseSerializer(user_response).data,
-                    "correct_option": question.correct_option  # Add the correct option for failed questions
-                }
-                failed_questions_by_subject[subject].append(failed_question)
-
-        return failed_questions_by_subject
+        document = get_result_document(user.id, session_id)
+        if document is None:
+            test_session = get_object_or_404(TestSession, id=session_id, user=user)
+
+            if not test_session.completed:
+                return Response(format_error_response(
+                    status.HTTP_400_BAD_REQUEST, 
+                    "INCOMPLETE_TEST_SESSION", 
+                    "The test session is not yet completed."
+                ))
+
+            document = build_result_document(test_session)
+
+        etag, document_json = with_percentiles(*document)
+        etag = f'"{etag}"'
+        if etag in request.headers.get('If-None-Match', ''):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            # Already rendered JSON; sent as-is rather than serialized again
+            response = HttpResponse(document_json, content_type='application/json')
+
+        response['ETag'] = etag
+        # A session still being graded gets a new document, so clients revalidate every time
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
@@ -0,0 +1,85 @@
+from .models import Worksheet, Question
+from .cache_utils import SharedSnapshot
+
+INDEX_VERSION_KEY = 'worksheet_index_version'
+
+
+class WorksheetIndex:
+    """
+    Immutable, process-resident snapshot of subject -> worksheet ids -> ordered question ids.
+    """
+
+    def __init__(self, version, subject_worksheets, worksheets):
+        self.version = version
+        # {subject_id: (worksheet_id, ...)} ordered by worksheet id
+        self.subject_worksheets = subject_worksheets
+        # {worksheet_id: {"subject_id": ..., "name": ..., "question_ids": (...)}}
+        self.worksheets = worksheets
+        # {worksheet_id: position within its subject's worksheet ids}
+        self.worksheet_positions = {
+            worksheet_id: position
+            for worksheet_ids in subject_worksheets.values()
+            for position, worksheet_id in enumerate(worksheet_ids)
+        }
+        # {question_id: worksheet_id}
+        self.question_worksheets = {
+            question_id: worksheet_id
+            for worksheet_id, worksheet in worksheets.items()
+            for question_id in worksheet["question_ids"]
+        }
+
+    @classmethod
+    def load(cls, version):
+        """
+        Build a snapshot with two queries, whatever the number of subjects and worksheets.
+        """
+        subject_worksheets = {}
+        worksheets = {}
+        for worksheet_id, subject_id, name in Worksheet.objects.order_by('id').values_list('id', 'subject_id', 'name'):
+            subject_worksheets.setdefault(subject_id, []).append(worksheet_id)
+            worksheets[worksheet_id] = {"subject_id": subject_id, "name": name, "question_ids": []}
+
+        # Matches Question.Meta.ordering, with id as a stable tie-breaker. The two reads are not
+        # one snapshot, so questions of a worksheet created in between are left to the next reload
+        for question_id, worksheet_id in Question.objects.order_by('order', 'id').values_list('id', 'worksheet_id'):
+            if worksheet_id in worksheets:
+                worksheets[worksheet_id]["question_ids"].append(question_id)
+
+        for worksheet in worksheets.values():
+            worksheet["question_ids"] = tuple(worksheet["question_ids"])
+
+        return cls(
+            version,
+            {subject_id: tuple(ids) for subject_id, ids in subject_worksheets.items()},
+            worksheets,
+        )
+
+    def get_worksheet_ids(self, subject_id):
+        return self.subject_worksheets.get(subject_id, ())
+
+    def get_worksheet(self, worksheet_id):
+        return self.worksheets.get(worksheet_id)
+
+    def get_worksheet_position(self, worksheet_id):
+        return self.worksheet_positions.get(worksheet_id)
+
+    def get_question_ids(self, worksheet_id):
+        worksheet = self.worksheets.get(worksheet_id)
+        return worksheet["question_ids"] if worksheet else ()
+
+    def get_question_worksheet(self, question_id):
+        return self.question_worksheets.get(question_id)
+
+
+_index = SharedSnapshot(INDEX_VERSION_KEY, WorksheetIndex.load)
+
+
+def get_worksheet_index():
+    """
+    Return this worker's index, reloading it only when the shared version has moved.
+    """
+    return _index.get()
+
+
+def invalidate_worksheet_index():
+    _index.invalidate()